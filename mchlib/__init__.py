@@ -0,0 +1,114 @@
+#*****************************************************************************#
+#    Copyright (C) 2024 Shunsq                                                #
+#    Copyright (C) 2024 Julian Xhokaxhiu                                      #
+#                                                                             #
+#    This file is part of FF8 MCH                                             #
+#                                                                             #
+#    FF8 MCH is free software: you can redistribute it and/or modify          #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License            #
+#                                                                             #
+#    FF8 MCH is distributed in the hope that it will be useful,               #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#*****************************************************************************#
+
+###
+# PLEASE NOTE:
+# THIS PACKAGE DOES NOT NEED BLENDER. YOU CAN IMPORT IT FROM PLAIN PYTHON
+# BY ADDING THE ff8_mch FOLDER TO sys.path AND DOING "import mchlib"
+###
+
+"""***********************************************
+*********FF8 field model parsing core*************
+**********************************************"""
+from .mch import (
+    MchHeader_class,
+    MchVertex_class,
+    MchUV_class,
+    MchFace_class,
+    MchFaces_class,
+    MchBone_class,
+    MchSkeleton_class,
+    MchPose_class,
+    MchFrame_class,
+    MchAnim_class,
+    MchSkin_class,
+    MchModel_class,
+    MchFile,
+    BONE_NAMES,
+    BuildSkeleton,
+    ReadBone,
+    BoneSequence,
+    NameBones,
+    ReadRestPose,
+    ModelScale,
+    ReadVertices,
+    ReadFaces,
+    WeldUVs,
+    ReadSkins,
+    DecodeModel,
+    ReadModel,
+)
+from .one import (
+    MchAlone_class,
+    ReadCharaOne,
+    CharaOneIndex,
+    ReadScale,
+    ReadNpcModel,
+    ReadActHeaders,
+    DecodeAct,
+    EncodeAct,
+    EncodeAnims,
+    WriteAnims,
+    ReadAnims,
+)
+from .tim import (
+    CLUT_class,
+    TimImage_class,
+    ColorsToRGBA,
+    ReadTim,
+    DecodeTim,
+    ReadTextures,
+)
+from .cache import (
+    MchCache,
+    ActHash,
+    ModelToArrays,
+    ModelFromArrays,
+    ReadModelCached,
+    ReadNpcModelCached,
+    AnimsToArrays,
+    AnimsFromArrays,
+    ReadAnimsCached,
+    ReadActsCached,
+)
+from .rig import (
+    EulerToMatrix,
+    MatrixToEuler,
+    CompatibleEuler,
+    ContinuousEuler,
+    RawEulers,
+    RawLocations,
+    PoseMatrices,
+    PoseRotations,
+    RetargetPose,
+    RetargetAnim,
+    QuaternionToMatrix,
+    RetargetToRaw,
+    ReduceKeys,
+    RAW_ROOT_X,
+    RAW_ROOT_Y,
+    RawProfile,
+    VectorRollToMatrix,
+    RawRest,
+    RawRests,
+    DeltaRotations,
+)
+from .batch import (
+    MchCharacter_class,
+    ReadCharacter,
+    DecodeCharaOnes,
+    DecodeCharaOne,
+)
@@ -0,0 +1,81 @@
+#*****************************************************************************#
+#    Copyright (C) 2024 Shunsq                                                #
+#    Copyright (C) 2024 Julian Xhokaxhiu                                      #
+#                                                                             #
+#    This file is part of FF8 MCH                                             #
+#                                                                             #
+#    FF8 MCH is free software: you can redistribute it and/or modify          #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License            #
+#                                                                             #
+#    FF8 MCH is distributed in the hope that it will be useful,               #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#*****************************************************************************#
+
+"""***********************************************
+*********Parallel chara.one decoding (no bpy)*****
+**********************************************"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from .one import CharaOneIndex
+from .cache import ReadNpcModelCached,ReadAnimsCached
+
+#Workers are separate processes:on Windows and macOS(spawn) the calling script
+#must be guarded by if __name__=="__main__":
+
+class MchCharacter_class:
+    """Class defining a decoded chara.one character
+        -alone#MchAlone_class, its table entry
+        -model#MchModel_class of a NPC, None for a main character(its model is a .mch file)
+        -anims#list of MchAnim_class"""
+    def __init__(self) :#constructor
+        self.alone=None
+        self.model=None
+        self.anims=[]
+    def __repr__(self):
+        return("{} model:{} anims:{}\n".format(self.alone.name,self.model is not None,len(self.anims)))
+
+def ReadCharacter(onepath,char_name,cache=None):
+    """Decode the acts and the NPC model of the chara.one character char_name, None if the chara.one doesn't contain it"""
+    alone,anims=ReadAnimsCached(onepath,char_name,cache)
+    if alone is None:
+        return None
+    character=MchCharacter_class()
+    character.alone=alone
+    character.anims=anims
+    character.model=ReadNpcModelCached(onepath,char_name,cache)
+    return character
+
+def _ReadCharacterTask(task):
+    #runs in a worker:returns the character only if the caller wants it back
+    onepath,char_name,cache,results=task
+    character=ReadCharacter(onepath,char_name,cache)
+    return onepath,char_name,character if results else None
+
+def DecodeCharaOnes(onepaths,processes=None,cache=None,results=True):
+    """Decode every character of the chara.one files onepaths, the characters being shared by a pool of processes
+    (processes=None:one per core, 1:no pool). Returns {onepath:{char_name:MchCharacter_class}}.
+    With results=False the characters are only written to cache(a MchCache) and None is returned:
+    nothing is sent back from the workers"""
+    if not results and cache is None:
+        raise ValueError("results=False needs a cache")
+    tasks=[(onepath,char_name,cache,results) for onepath in onepaths for char_name in CharaOneIndex(onepath)]
+    merged={onepath:{} for onepath in onepaths}
+    if processes==1:
+        done=list(map(_ReadCharacterTask,tasks))
+    else:
+        workers=processes or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            #a few chunks per worker:small characters don't pay one round trip each, big fields still balance
+            done=list(pool.map(_ReadCharacterTask,tasks,chunksize=max(1,len(tasks)//(workers*4))))
+    for onepath,char_name,character in done:
+        if results:
+            merged[onepath][char_name]=character
+    return merged if results else None
+
+def DecodeCharaOne(onepath,processes=None,cache=None,results=True):
+    """DecodeCharaOnes of a single chara.one:{char_name:MchCharacter_class}"""
+    merged=DecodeCharaOnes([onepath],processes,cache,results)
+    return None if merged is None else merged[onepath]
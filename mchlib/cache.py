@@ -0,0 +1,292 @@
+#*****************************************************************************#
+#    Copyright (C) 2024 Shunsq                                                #
+#    Copyright (C) 2024 Julian Xhokaxhiu                                      #
+#                                                                             #
+#    This file is part of FF8 MCH                                             #
+#                                                                             #
+#    FF8 MCH is free software: you can redistribute it and/or modify          #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License            #
+#                                                                             #
+#    FF8 MCH is distributed in the hope that it will be useful,               #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#*****************************************************************************#
+
+"""***********************************************
+*********On-disk cache of decoded data (no bpy)***
+**********************************************"""
+import os,hashlib,shutil
+import numpy as np
+from .mch import (
+    MchHeader_class,
+    MchBone_class,
+    MchAnim_class,
+    MchSkin_class,
+    MchModel_class,
+    NameBones,
+    BuildSkeleton,
+    ReadModel,
+)
+from .one import CharaOneIndex,ReadNpcModel,ReadActHeaders,DecodeAct,ReadAnims
+
+#bump it when the decoders change, old entries are then never read again
+CACHE_VERSION=3
+CACHE_DIR=os.path.join(os.path.expanduser("~"),".cache","ff8_mch")
+CACHE_SIZE=512*1024*1024#bytes
+
+HEADER_FIELDS=["ModelAddress","BoneCount","VCount","TexAnimSize","FCount","Unk1Count","ObCount","Unk2Count",\
+"TriCount","QuadCount","BoneOffset","VOffset","TexAnimOffset","FOffset","Unk1Offset","ObOffset","AnimOffset","Unk2Offset","AnimCount"]
+
+class MchCache:
+    """Class defining the decoded data cache. An entry is a folder named after the hash of its sources,
+    holding one .npy file per array so that it can be loaded memory mapped.
+    The least recently used entries are removed when the folder grows over max_size bytes"""
+    def __init__(self,directory=CACHE_DIR,max_size=CACHE_SIZE) :#constructor
+        self.directory=directory
+        self.max_size=max_size
+        os.makedirs(self.directory,exist_ok=True)
+    def __repr__(self):
+        return("directory:{} max_size:{}\n".format(self.directory,self.max_size))
+
+    def key(self,*parts):
+        """Hash of the cache version and of parts(bytes-like or str)"""
+        digest=hashlib.blake2b(str(CACHE_VERSION).encode(),digest_size=20)
+        for part in parts:
+            if isinstance(part,str):
+                part=part.encode()
+            digest.update(len(part).to_bytes(8,'little'))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def load(self,key):
+        """Arrays of the entry key(read only, memory mapped), None if it isn't cached"""
+        path=os.path.join(self.directory,key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            arrays={os.path.splitext(file)[0]:np.load(os.path.join(path,file),mmap_mode='r',allow_pickle=False)\
+for file in os.listdir(path) if file.endswith(".npy")}
+            os.utime(path)#most recently used
+        except (OSError,ValueError):#broken entry
+            shutil.rmtree(path,ignore_errors=True)
+            return None
+        return arrays
+
+    def store(self,key,arrays):
+        """Write the arrays(name:array) of the entry key, then evict"""
+        path=os.path.join(self.directory,key)
+        temp="{}.{}.tmp".format(path,os.getpid())
+        os.makedirs(temp,exist_ok=True)
+        for name,array in arrays.items():
+            np.save(os.path.join(temp,name+".npy"),np.asarray(array),allow_pickle=False)
+        try:
+            os.rename(temp,path)
+        except OSError:#stored meanwhile by another process
+            shutil.rmtree(temp,ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_size"""
+        entries=[]
+        total=0
+        for key in os.listdir(self.directory):
+            path=os.path.join(self.directory,key)
+            if key.endswith(".tmp") or not os.path.isdir(path):
+                continue
+            try:
+                size=sum(entry.stat().st_size for entry in os.scandir(path))
+            except OSError:#removed meanwhile by another process
+                continue
+            entries.append((os.path.getmtime(path),size,path))
+            total+=size
+        for mtime,size,path in sorted(entries):
+            if total<=self.max_size:
+                break
+            shutil.rmtree(path,ignore_errors=True)
+            total-=size
+
+    def clear(self):
+        """Remove every entry"""
+        shutil.rmtree(self.directory,ignore_errors=True)
+        os.makedirs(self.directory,exist_ok=True)
+
+def ActHash(anim,*profile):
+    """Hash of the frames of an act(MchAnim_class) and of a skeleton profile(str, bytes-like or arrays).
+    Identical acts of characters sharing a skeleton get the same hash"""
+    digest=hashlib.blake2b(str(CACHE_VERSION).encode(),digest_size=20)
+    for part in (np.asarray(anim.offsets,dtype='<i2'),np.asarray(anim.rotations,dtype='<i2'))+profile:
+        if isinstance(part,str):
+            part=part.encode()
+        elif isinstance(part,np.ndarray):
+            part=repr(part.shape).encode()+np.ascontiguousarray(part).tobytes()
+        digest.update(len(part).to_bytes(8,'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+def FileBytes(filepath):
+    with open(filepath,"rb") as inputfile:
+        return inputfile.read()
+
+def ModelToArrays(model):
+    """Arrays of a decoded MchModel_class"""
+    header=model.header
+    arrays={
+        "header":np.array([getattr(header,field) for field in HEADER_FIELDS],dtype=np.int64),
+        "char_name":np.array(header.char_name),
+        "scale":np.array(model.scale,dtype=np.float64),
+        "bones":np.array([(bone.parent,bone.length,bone.Nbchild,bone.Chainlength) for bone in model.boneList],dtype=np.int64).reshape(-1,4),
+        "restpose_offsets":model.restPose.offsets,
+        "restpose_rotations":model.restPose.rotations,
+        "restpose_counts":np.array([model.restPose.frameCount,model.restPose.boneCount],dtype=np.int64),
+        "vertices":model.Vlist,
+        "is_tri":model.faces.is_tri,
+        "face_vertices":model.faces.vertices,
+        "face_uvs":model.faces.uvs,
+        "texgroup":model.faces.texgroup,
+        "vt":model.faces.vt,
+        "uvs":model.UVlist,
+        "skins":np.array([(skin.vertexFirst,skin.vertexCount,skin.bone) for skin in model.skinGroups],dtype=np.int64).reshape(-1,3),
+    }
+    for i,texture in enumerate(model.textures):
+        arrays["texture{}".format(i)]=texture
+    return arrays
+
+def ModelFromArrays(arrays):
+    """MchModel_class rebuilt from its cached arrays. Big arrays stay memory mapped"""
+    model=MchModel_class()
+    header=MchHeader_class()
+    for field,value in zip(HEADER_FIELDS,arrays["header"].tolist()):
+        setattr(header,field,value)
+    header.char_name=str(arrays["char_name"])
+    model.header=header
+    model.scale=float(arrays["scale"])
+
+    for parent,length,Nbchild,Chainlength in arrays["bones"].tolist():
+        bone=MchBone_class()
+        bone.parent=parent
+        bone.length=length
+        bone.Nbchild=Nbchild
+        bone.Chainlength=Chainlength
+        model.boneList.append(bone)
+    NameBones(model.boneList,header.char_name)
+    model.skeleton=BuildSkeleton(model.boneList)
+
+    model.restPose.frameCount,model.restPose.boneCount=arrays["restpose_counts"].tolist()
+    model.restPose.offsets=arrays["restpose_offsets"]
+    model.restPose.rotations=arrays["restpose_rotations"]
+
+    model.Vlist=arrays["vertices"]
+    model.faces.is_tri=arrays["is_tri"]
+    model.faces.vertices=arrays["face_vertices"]
+    model.faces.uvs=arrays["face_uvs"]
+    model.faces.texgroup=arrays["texgroup"]
+    model.faces.vt=arrays["vt"]
+    model.UVlist=arrays["uvs"]
+
+    for vertexFirst,vertexCount,bone in arrays["skins"].tolist():
+        skin=MchSkin_class()
+        skin.vertexFirst=vertexFirst
+        skin.vertexCount=vertexCount
+        skin.bone=bone
+        skin.name=model.boneList[bone].name
+        model.skinGroups.append(skin)
+
+    texcount=sum(1 for name in arrays if name.startswith("texture"))
+    model.textures=[arrays["texture{}".format(i)] for i in range(texcount)]
+    return model
+
+def ReadModelCached(filepath,onescale=0x100,cache=None):
+    """ReadModel, skipped when the same .mch bytes were already decoded with the same scale"""
+    if cache is None:
+        return ReadModel(filepath,onescale)
+    char_name=os.path.basename(filepath).split('.mch')[0]
+    key=cache.key("model",char_name,repr(float(onescale)),FileBytes(filepath))
+    arrays=cache.load(key)
+    if arrays is not None:
+        print("{} loaded from cache".format(char_name))
+        return ModelFromArrays(arrays)
+    model=ReadModel(filepath,onescale)
+    cache.store(key,ModelToArrays(model))
+    return model
+
+def ReadNpcModelCached(onepath,char_name,cache=None):
+    """ReadNpcModel of the chara.one character char_name, None for a main character or if the chara.one doesn't contain it.
+    The cache entry only depends on the bytes of that character"""
+    alone=CharaOneIndex(onepath).get(char_name)
+    if alone is None or alone.hasTim>0xd0000000:
+        return None
+    with open(onepath,"rb") as onefile:
+        onefile.seek(alone.Address,0)
+        block=onefile.read(alone.Size)
+    if cache is None:
+        return ReadNpcModel(block,alone)
+    key=cache.key("npc model",char_name,repr(float(alone.Scale)),block)
+    arrays=cache.load(key)
+    if arrays is not None:
+        print("{} loaded from cache".format(char_name))
+        return ModelFromArrays(arrays)
+    model=ReadNpcModel(block,alone)
+    cache.store(key,ModelToArrays(model))
+    return model
+
+def AnimsToArrays(animList):
+    """Arrays of the animations of a chara.one character(ReadAnims)"""
+    arrays={
+        "acts":np.array([(anim.frameCount,anim.boneCount,anim.oneAddress) for anim in animList],dtype=np.int64).reshape(-1,3),
+    }
+    for i,anim in enumerate(animList):
+        arrays["offsets{}".format(i)]=anim.offsets
+        arrays["rotations{}".format(i)]=anim.rotations
+    return arrays
+
+def AnimsFromArrays(arrays,alone):
+    """Animation list of the chara.one character alone rebuilt from the cached arrays"""
+    animList=[]
+    for i,(frameCount,boneCount,oneAddress) in enumerate(arrays["acts"].tolist()):
+        anim=MchAnim_class()
+        anim.name=alone.name+"_act{}".format(i)
+        anim.frameCount=frameCount
+        anim.boneCount=boneCount
+        anim.oneAddress=oneAddress
+        anim.offsets=arrays["offsets{}".format(i)]
+        anim.rotations=arrays["rotations{}".format(i)]
+        animList.append(anim)
+    return animList
+
+def ReadAnimsCached(onepath,char_name,cache=None):
+    """chara.one character char_name and its animations, (None,[]) if the chara.one doesn't contain it.
+    The cache entry only depends on the bytes of that character"""
+    alone=CharaOneIndex(onepath).get(char_name)
+    if alone is None:
+        return None,[]
+    with open(onepath,"rb") as onefile:
+        if cache is not None:
+            onefile.seek(alone.Address,0)
+            key=cache.key("anims",char_name,str(alone.AnimAddress),onefile.read(alone.Size))
+            arrays=cache.load(key)
+            if arrays is not None:
+                print("{} animations loaded from cache".format(char_name))
+                return alone,AnimsFromArrays(arrays,alone)
+        animList=ReadAnims(onefile,alone)
+    if cache is not None:
+        cache.store(key,AnimsToArrays(animList))
+    return alone,animList
+
+def ReadActsCached(onepath,char_name,acts,cache=None):
+    """Decoded acts(MchAnim_class) of the character char_name whose numbers are listed in acts.
+    Without cache only these acts are decoded, with a cache every act is decoded once then memory mapped.
+    Raises ValueError if the chara.one doesn't contain char_name or one of the acts"""
+    alone=CharaOneIndex(onepath).get(char_name)
+    if alone is None:
+        raise ValueError("no {} in {}".format(char_name,onepath))
+    missing=[i for i in acts if not 0<=i<alone.AnimCount]
+    if missing:
+        raise ValueError("{} has no act {} in {}".format(char_name,missing[0],onepath))
+    if cache is not None:
+        alone,animList=ReadAnimsCached(onepath,char_name,cache)
+        return [animList[i] for i in acts]
+    with open(onepath,"rb") as onefile:
+        actList=ReadActHeaders(onefile,alone)
+        return [DecodeAct(onefile,actList[i]) for i in acts]
@@ -0,0 +1,970 @@
+#*****************************************************************************#
+#    Copyright (C) 2024 Shunsq                                                #
+#    Copyright (C) 2024 Julian Xhokaxhiu                                      #
+#                                                                             #
+#    This file is part of FF8 MCH                                             #
+#                                                                             #
+#    FF8 MCH is free software: you can redistribute it and/or modify          #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License            #
+#                                                                             #
+#    FF8 MCH is distributed in the hope that it will be useful,               #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#*****************************************************************************#
+
+"""***********************************************
+*********MCH model parsing (no bpy)***************
+**********************************************"""
+import os,mmap,struct
+import numpy as np
+from .tim import ReadTextures
+
+class MchHeader_class:
+    """Class defining all adresses and values of MCH header:
+        -char_name
+        -ModelAddress;//address
+        -BoneCount;
+        -VCount;
+        -TexAnimSize;//texture anim size.Minimum is 0x14 ( for eye blinking)
+        -FCount;
+        -Unk1Count;//unknown data type 1 count
+        -ObCount;
+        -Unk2Count;//unknown data type 2 count
+        -TriCount;
+        -QuadCount;
+        -BoneOffset;
+        -VOffset;
+        -TexAnimOffset;//texture anim
+        -FOffset;
+        -Unk1Offset;//unknown data type 1
+        -ObOffset;
+        -AnimOffset;
+        -Unk2Offset;//unknown data type 2# Most the time 0x01FF0104
+        -AnimCount;"""
+    def __init__(self) :#constructor
+        self.char_name='none'
+        self.ModelAddress=0
+        self.BoneCount=0
+        self.VCount=0
+        self.TexAnimSize=0
+        self.FCount=0
+        self.Unk1Count=0
+        self.ObCount=0
+        self.Unk2Count=0
+        self.TriCount=0
+        self.QuadCount=0
+        self.BoneOffset=0
+        self.VOffset=0
+        self.TexAnimOffset=0
+        self.FOffset=0
+        self.Unk1Offset=0
+        self.ObOffset=0
+        self.AnimOffset=0
+        self.Unk2Offset=0
+        self.AnimCount=0
+    def __repr__(self):#print
+        return ("Name:{}  ModelAddress:{}  \
+BoneCount:{}  \
+VCount:{}  \
+TexAnimSize:{}  \
+FCount:{}\n\
+ObCount:{}  \
+TriCount:{}  \
+QuadCount:{}  \
+BoneOffset:{}  \
+VOffset:{}\n\
+TexAnimOffset:{}  \
+FOffset:{}  \
+Unk1Offset:{}  \
+ObOffset:{}  \
+AnimOffset:{}\n".format(
+    self.char_name,
+    hex(self.ModelAddress),
+    hex(self.BoneCount),
+    hex(self.VCount),
+    hex(self.TexAnimSize),
+    hex(self.FCount),
+    hex(self.ObCount),
+    hex(self.TriCount),
+    hex(self.QuadCount),
+    hex(self.BoneOffset),
+    hex(self.VOffset),
+    hex(self.TexAnimOffset),
+    hex(self.FOffset),
+    hex(self.Unk1Offset),
+    hex(self.ObOffset),
+    hex(self.AnimOffset)))
+
+class MchVertex_class:
+    """Class defining a MCH vertex(8bytes):
+        -x#2bytes
+        -y#2bytes
+        -z#2bytes
+        -2 unknown bytes"""
+    def __init__(self,x,y,z) :#constructor
+        self.x=x
+        self.y=y
+        self.z=z
+    #Comparison operators
+    def __eq__(self, other):#"=="
+        if isinstance(other,MchVertex_class):
+            return (self.x == other.x)and(self.y == other.y)and(self.z == other.z)#compare all dictionary
+        return NotImplemented
+    def __ne__(self, other):#"!="
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+    def __le__(self, other):
+        if isinstance(other,MchVertex_class):
+            return (self.x <= other.x)or((self.x == other.x)and(self.y <= other.y))or((self.x == other.x)and(self.y == other.y)and(self.z <=other.z))
+        return NotImplemented
+    def __lt__(self, other):
+        if isinstance(other,MchVertex_class):
+            return (self.x < other.x)or((self.x == other.x)and(self.y < other.y))or((self.x == other.x)and(self.y == other.y)and(self.z <other.z))
+        return NotImplemented
+    def __ge__(self, other):
+        if isinstance(other,MchVertex_class):
+            return (self.x >= other.x)or((self.x == other.x)and(self.y >= other.y))or((self.x == other.x)and(self.y == other.y)and(self.z >=other.z))
+        return NotImplemented
+    def __gt__(self, other):
+        if isinstance(other,MchVertex_class):
+            return (self.x >other.x)or((self.x == other.x)and(self.y > other.y))or((self.x == other.x)and(self.y == other.y)and(self.z >other.z))
+        return NotImplemented
+
+
+class MchUV_class:
+    """Class defining a MCH vertex(8bytes):
+        -x#1byte
+        -y#1byte"""
+    def __init__(self,u,v) :#constructor
+        self.u=u
+        self.v=v
+    #Comparison operators
+    def __eq__(self, other):#"=="
+        if isinstance(other,MchUV_class):
+            return (self.u== other.u)and(self.v==other.v)#compare all dictionary
+        return NotImplemented
+    def __ne__(self, other):#"!="
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+    def __le__(self, other):
+        if isinstance(other,MchUV_class):
+            return (self.u <= other.u)or((self.u == other.u)and(self.v <= other.v))
+        return NotImplemented
+    def __lt__(self, other):
+        if isinstance(other,MchUV_class):
+            return (self.u < other.u)or((self.u == other.u)and(self.v < other.v))
+        return NotImplemented
+    def __ge__(self, other):
+        if isinstance(other,MchUV_class):
+            return (self.u >= other.u)or((self.u == other.u)and(self.v >= other.v))
+        return NotImplemented
+    def __gt__(self, other):
+        if isinstance(other,MchUV_class):
+            return (self.u > other.u)or((self.u == other.u)and(self.v > other.v))
+
+class MchFace_class:
+    """Class defining a MCH face(64bytes):
+        -is_tri #Triangle if 0x25010607 and Quad if 0x2d010709
+        -8 unused bytes
+        -v1 #2bytes
+        -v2 #2bytes
+        -v3 #2bytes
+        -v4 #2bytes
+        -24 unused bytes
+        -vt1 #1byte
+        -vt2 #1byte
+        -vt3 #1byte
+        -vt4 #1byte
+        -2 unused bytes
+        -texgroup# 2bytes
+        -12 unused bytes"""
+    def __init__(self) :#constructor
+        self.is_tri=0
+        self.v1=0
+        self.v2=0
+        self.v3=0
+        self.v4=0
+        self.vt1=0
+        self.vt2=0
+        self.vt3=0
+        self.vt4=0
+        self.texgroup=0
+
+class MchFaces_class:
+    """Class defining the whole MCH face table, one row per face:
+        -is_tri#(FCount,) bool
+        -vertices#(FCount,4) v1,v2,v3,v4 in blender winding order. v4 is unused for triangles
+        -uvs#(FCount,4,2) uv of each corner in pixels, V flipped and offset by texture group
+        -texgroup#(FCount,)
+        -vt#(FCount,4) index of each corner uv in the unique uv list"""
+    def __init__(self) :#constructor
+        self.is_tri=np.zeros(0,dtype=bool)
+        self.vertices=np.zeros((0,4),dtype=np.int32)
+        self.uvs=np.zeros((0,4,2),dtype=np.int32)
+        self.texgroup=np.zeros(0,dtype=np.int32)
+        self.vt=np.zeros((0,4),dtype=np.int32)
+    def __len__(self):
+        return len(self.is_tri)
+
+class MchBone_class:
+    """Class defining a MCH bone(64bytes):
+        -parent
+        -length
+        -name
+        -head#(x,y,z)
+        -tail#(x,y,z)
+        -Nbchild
+        -Chainlength"""
+    def __init__(self) :#constructor
+        self.parent=-1#-1 if no parent
+        self.length=0
+        self.name='none'
+        self.head=(0,0,0)#obtained with restpose data
+        self.tail=(0,0,0)#obtained with restpose data
+
+        self.Nbchild=0
+        self.Chainlength=1
+    def __repr__(self):
+        return("name:{} parent:{} length:{} head:{} tail:{} Nbchild:{} Chainlength:{}\n"\
+.format(self.name,hex(self.parent),hex(self.length),self.head,self.tail,hex(self.Nbchild),hex(self.Chainlength)))
+
+class MchSkeleton_class:
+    """Class defining a skeleton as arrays, built in O(bones) by BuildSkeleton
+        -parents#(B,) parent of each bone, -1 for a root
+        -lengths#(B,) raw bone lengths
+        -names#bone names
+        -index#name:bone number, the first bone wins
+        -firstChild#(B,) first child of each bone, -1 without child
+        -nextSibling#(B,) next child of the same parent, -1 for the last one
+        -childCount#(B,) number of children(MchBone_class.Nbchild)
+        -order#(B,) bone numbers, parents before their children
+        -subtree#(B,) number of descendants(MchBone_class.Chainlength)"""
+    def __init__(self) :#constructor
+        self.parents=np.zeros(0,dtype=np.int32)
+        self.lengths=np.zeros(0,dtype=np.int32)
+        self.names=[]
+        self.index={}
+        self.firstChild=np.zeros(0,dtype=np.int32)
+        self.nextSibling=np.zeros(0,dtype=np.int32)
+        self.childCount=np.zeros(0,dtype=np.int32)
+        self.order=np.zeros(0,dtype=np.int32)
+        self.subtree=np.zeros(0,dtype=np.int32)
+    def __len__(self):
+        return len(self.parents)
+    def __repr__(self):
+        return("bones:{} roots:{}\n".format(len(self.parents),np.count_nonzero(self.parents<0)))
+
+class MchPose_class:
+    """Class defining a MCH pose, a Euler rotation matrix XYZ
+        -rotX#euler rotation vector around local X axis
+        -rotY#euler rotation vector around local Y axis
+        -rotZ#euler rotation vector around local Z axis"""
+    def __init__(self) :#constructor
+        self.rotX=0
+        self.rotY=0
+        self.rotZ=0
+    def __repr__(self):
+        return("rotX:{} rotY:{} rotZ:{}\n"\
+.format(self.rotX,self.rotY,self.rotZ))
+
+class MchFrame_class:
+    """Class defining a MCH frame
+        -Offset
+        -poseList"""
+    def __init__(self) :#constructor
+        self.Offset=(0,0,0)
+        self.poseList=[]
+    def __repr__(self):
+        return("Offset:{}\n".format(self.Offset))
+
+class MchAnim_class:
+    """Class defining a MCH anim
+        -name
+        -framecount
+        -bonecount
+        -oneAddress#address in chara.one
+        -offsets#(frameCount,3) int16 root offset x,y,z, 1/256 units
+        -rotations#(frameCount,boneCount,3) int16 rotX,rotY,rotZ of each bone, 0x800 is pi"""
+    def __init__(self) :#constructor
+        self.name='none'
+        self.frameCount=0
+        self.boneCount=0
+        self.oneAddress=0#Address in chara.one
+        self.offsets=np.zeros((0,3),dtype=np.int16)
+        self.rotations=np.zeros((0,0,3),dtype=np.int16)
+    def __repr__(self):
+        return("name:{} frameCount:{} boneCount:{} oneAddress:{}\n"\
+.format(self.name,hex(self.frameCount),hex(self.boneCount),hex(self.oneAddress)))
+
+class MchSkin_class:
+    """Class defining a Skin group(8 bytes):
+        -vertexFirstx#2bytes
+        -vertexCount#2bytes
+        -bone#2bytes
+
+        -faceCount
+        -faceList
+        -vertexIdList
+        -name"""
+    def __init__(self) :#constructor
+        self.vertexFirst=0
+        self.vertexCount=0
+        self.bone=0
+        self.faceCount=0
+        self.faceList=[]
+        self.vertexIdList=[]
+        self.name='none'
+    def __repr__(self):
+        return("name: {} vFirst:{} vCount:{} bone:{} fCount:{}\n"\
+.format(self.name,hex(self.vertexFirst),hex(self.vertexCount),hex(self.bone),hex(self.faceCount)))
+
+class MchModel_class:
+    """Class defining a decoded MCH model, plain python data only
+        -header
+        -scale#vertex divider
+        -boneList
+        -skeleton#MchSkeleton_class of boneList
+        -restPose#MchAnim_class, first frame of the MCH anim block
+        -Vlist#(VCount,3) float32 array
+        -faces#MchFaces_class
+        -UVlist#(UVCount,2) unique uvs, referenced by the vt of the faces
+        -skinGroups
+        -textures#RGBA arrays of the TIM textures"""
+    def __init__(self) :#constructor
+        self.header=MchHeader_class()
+        self.scale=0x100
+        self.boneList=[]
+        self.skeleton=MchSkeleton_class()
+        self.restPose=MchAnim_class()
+        self.Vlist=np.zeros((0,3),dtype=np.float32)
+        self.faces=MchFaces_class()
+        self.UVlist=np.zeros((0,2),dtype=np.int32)
+        self.skinGroups=[]
+        self.textures=[]
+    def __repr__(self):
+        return("{}scale:{} bones:{} vertices:{} faces:{} uvs:{} skins:{} textures:{}\n"\
+.format(self.header,self.scale,len(self.boneList),len(self.Vlist),len(self.faces),len(self.UVlist),len(self.skinGroups),len(self.textures)))
+
+
+BONE_NAMES=\
+["root","upperbody","lowerbody","neck","collar0","collar1","collar2","collar3","collar4",\
+"collar5","breast_L","breast_R","cape0","cape1","cape2","cape3","cape4","cape5",\
+"head","hair0","hair1","hair2","hair3","hair4","hair5","shoulder_L","shoulder_R",\
+"arm_L","arm_R","forearm_L","forearm_R","hand_L","hand_R","dress0","dress1","dress2",\
+"dress3","dress4","dress5","dress6","hip_L","hip_R","belt0","belt1","belt2",\
+"belt3","belt4","belt5","thigh_L","thigh_R","tibia_L","tibia_R","foot_L","foot_R"]
+
+#For FF8 remaster
+ff8REmdiv = [["d000", 104],
+["d001", 75],
+["d002", 75],
+["d003", 75],
+["d005", 75],
+["d006", 75],
+["d007", 75],
+["d009", 75],
+["d010", 75],
+["d011", 75],
+["d012", 75],
+["d014", 75],
+["d015", 74],
+["d016", 74],
+["d017", 74],
+["d018", 100],
+["d019", 100],
+["d020", 100],
+["d021", 100],
+["d022", 104],
+["d023", 104],
+["d024", 104],
+["d025", 104],
+["d026", 104],
+["d027", 104],
+["d028", 104],
+["d029", 104],
+["d030", 104],
+["d032", 70],
+["d033", 70],
+["d034", 70],
+["d037", 70],
+["d040", 74],
+["d041", 74],
+["d043", 75],
+["d044", 75],
+["d045", 80],
+["d046", 80],
+["d047", 47],
+["d048", 47],
+["d049", 75],
+["d050", 100],
+["d051", 104],
+["d052", 104],
+["d054", 500],
+["d055", 500],
+["d056", 500],
+["d057", 500],
+["d058", 500],
+["d059", 840],
+["d060", 150],
+["d061", 150],
+["d062", 150],
+["d065", 70],
+["d066", 150],
+["d067", 150],
+["d068", 150],
+["d069", 150],
+["d070", 150],
+["d071", 75],
+["d072", 80],
+["d073", 47],
+["d074", 74],
+["d075", 104],
+["n002", 19],
+["n010", 55],
+["n029", 7],
+["o028", 300],
+["o029", 300],
+["p001", 150],
+["p002", 150],
+["p004", 150],
+["p005", 150],
+["p006", 150],
+["p007", 150],
+["p008", 150],
+["p010", 150],
+["p011", 150],
+["p012", 6],
+["p013", 150],
+["p015", 150],
+["p017", 150],
+["p018", 62],
+["p021", 150],
+["p022", 150],
+["p024", 150],
+["p025", 150],
+["p028", 150],
+["p030", 150],
+["p031", 150],
+["p034", 150],
+["p037", 150],
+["p042", 150],
+["p043", 150],
+["p044", 150],
+["p045", 150],
+["p047", 150],
+["p048", 300],
+["p049", 150],
+["p056", 150],
+["p058", 300],
+["p061", 150],
+["p063", 150],
+["p064", 150],
+["p070", 150],
+["p074", 150],
+["p078", 150],
+["p086", 150],
+["p087", 150],
+["p090", 150],
+["p094", 150],
+["p101", 150],
+["p105", 150],
+["p106", 150],
+["p107", 150],
+["p119", 150],
+["p120", 150],
+["p121", 150],
+["p122", 500],
+["p123", 32],
+["p124", 150],
+["p125", 75],
+["p133", 150],
+["p137", 67],
+["p138", 150],
+["p142", 45],
+["p143", 150],
+["p144", 150],
+["p147", 150],
+["p161", 150],
+["p162", 150],
+["p163", 150],
+["p164", 150],
+["p168", 150],
+["p169", 150],
+["p170", 150],
+["p171", 150],
+["p172", 150],
+["p173", 45],
+["p180", 150],
+["p183", 150]]
+
+
+MCH_HEADER=struct.Struct('<7I2H8I')#64 bytes model header
+MCH_BONE=struct.Struct('<H6xh54x')#parent,length
+MCH_VERTEX=struct.Struct('<hhh2x')#x,y,z
+MCH_FACE=np.dtype([
+    ('is_tri','<u4'),#Triangle if 0x25010607 and Quad if 0x2d010709
+    ('unk0','V8'),
+    ('v','<u2',4),#v2,v1,v3,v4
+    ('unk1','V24'),#normals and vertex colors
+    ('uv','u1',(4,2)),#same order as face vertices
+    ('unk2','V2'),
+    ('texgroup','<u2'),
+    ('unk3','V8')])#64 bytes
+BLENDER_CORNERS=[1,0,2,3]#file corner order v2,v1,v3,v4 to blender order v1,v2,v3,v4
+MCH_SKIN=struct.Struct('<HHH2x')#vertexFirst,vertexCount,bone
+MCH_RESTPOSE=struct.Struct('<HHHhhh')#anim count,frame count,bone count,offset y,x,z
+MCH_ROTATION=struct.Struct('<HHH')#rotX,rotY,rotZ
+
+class MchFile:
+    """Class mapping a .MCH file in memory. The model header is unpacked once and every section is a memoryview on the mapping:
+        -header#MchHeader_class
+        -TexOffsets#address of each TIM texture
+        -bones#BoneCount*64 bytes
+        -vertices#VCount*8 bytes
+        -texanim#TexAnimSize bytes
+        -faces#FCount*64 bytes
+        -unk1#Unk1Count*32 bytes
+        -skins#ObCount*8 bytes
+        -anim#from AnimOffset to the end of the model
+    source is a file path, or any bytes-like object(a chara.one holding a NPC model).
+    Give ModelAddress(and end) to read a model that has no texture table in front of it."""
+    def __init__(self,source,ModelAddress=None,end=None) :#constructor
+        self.filepath=None
+        self._mmap=None
+        self._views=[]
+        if isinstance(source,(str,os.PathLike)):
+            self.filepath=source
+            with open(source,"rb") as inputfile:
+                self._mmap=mmap.mmap(inputfile.fileno(),0,access=mmap.ACCESS_READ)
+            self.data=self._view(memoryview(self._mmap))
+        else:
+            self.data=self._view(memoryview(source).cast('B'))
+        if end is None:
+            end=len(self.data)
+
+        self.TexOffsets=[]
+        if ModelAddress is None:
+            #Skip the texture maps
+            pos=0
+            while pos+8<=len(self.data):
+                texoffset,=struct.unpack_from('<I',self.data,pos)
+                pos+=4
+                if texoffset==0xffffffff:
+                    break
+                self.TexOffsets.append(texoffset&0xffffff)
+            #get address of header(after all the texture maps)
+            ModelAddress,=struct.unpack_from('<I',self.data,pos)
+
+        header=MchHeader_class()
+        header.ModelAddress=ModelAddress
+        (header.BoneCount,
+        header.VCount,
+        header.TexAnimSize,
+        header.FCount,
+        header.Unk1Count,
+        header.ObCount,
+        header.Unk2Count,
+        header.TriCount,
+        header.QuadCount,
+        header.BoneOffset,
+        header.VOffset,
+        header.TexAnimOffset,
+        header.FOffset,
+        header.Unk1Offset,
+        header.ObOffset,
+        header.AnimOffset,
+        header.Unk2Offset)=MCH_HEADER.unpack_from(self.data,ModelAddress)
+        self.header=header
+
+        self.bones=self._section(header.BoneOffset,header.BoneCount*MCH_BONE.size)
+        self.vertices=self._section(header.VOffset,header.VCount*8)
+        self.texanim=self._section(header.TexAnimOffset,header.TexAnimSize)
+        self.faces=self._section(header.FOffset,header.FCount*64)
+        self.unk1=self._section(header.Unk1Offset,header.Unk1Count*32)
+        self.skins=self._section(header.ObOffset,header.ObCount*MCH_SKIN.size)
+        self.anim=self._view(self.data[ModelAddress+header.AnimOffset:end])
+
+        #get anim count
+        if len(self.anim)>=2:
+            header.AnimCount,=struct.unpack_from('<H',self.anim,0)
+
+    def _view(self,view):
+        self._views.append(view)
+        return view
+
+    def _section(self,offset,size):
+        start=self.header.ModelAddress+offset
+        return self._view(self.data[start:start+size])
+
+    def close(self):
+        """Release the section views and unmap the file"""
+        for view in reversed(self._views):
+            try:
+                view.release()
+            except BufferError:#still exported(numpy array on it), left to the garbage collector
+                pass
+        self._views=[]
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap=None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def __repr__(self):
+        return "{}".format(self.header)
+
+def BuildSkeleton(boneList):
+    """MchSkeleton_class of a bone list:child links, parent first order, subtree sizes and name index, all in O(bones).
+    The Nbchild and Chainlength of the bones are set from it"""
+    count=len(boneList)
+    skeleton=MchSkeleton_class()
+    parents=np.array([bone.parent for bone in boneList],dtype=np.int32).reshape(count)
+    #a bone pointing to itself or out of the list is a root
+    parents[(parents>=count)|(parents==np.arange(count))]=-1
+    parents[parents<0]=-1
+    skeleton.parents=parents
+    skeleton.lengths=np.array([bone.length for bone in boneList],dtype=np.int32).reshape(count)
+    skeleton.names=[bone.name for bone in boneList]
+    for i,name in enumerate(skeleton.names):
+        skeleton.index.setdefault(name,i)
+
+    #children linked from the last one so that siblings stay in bone order
+    firstChild=np.full(count,-1,dtype=np.int32)
+    nextSibling=np.full(count,-1,dtype=np.int32)
+    for bone,parent in reversed(list(enumerate(parents.tolist()))):
+        if parent>=0:
+            nextSibling[bone]=firstChild[parent]
+            firstChild[parent]=bone
+    skeleton.firstChild=firstChild
+    skeleton.nextSibling=nextSibling
+    skeleton.childCount=np.bincount(parents[parents>=0],minlength=count).astype(np.int32)
+
+    #breadth first from the roots:parents before children
+    order=np.flatnonzero(parents<0).tolist()
+    for bone in order:#order grows while it is read
+        child=firstChild[bone]
+        while child>=0:
+            order.append(int(child))
+            child=nextSibling[child]
+    skeleton.order=np.array(order,dtype=np.int32)
+
+    #descendants, accumulated from the leaves
+    subtree=np.zeros(count,dtype=np.int32)
+    for bone in reversed(order):
+        if parents[bone]>=0:
+            subtree[parents[bone]]+=subtree[bone]+1
+    skeleton.subtree=subtree
+    for bone,Nbchild,Chainlength in zip(boneList,skeleton.childCount.tolist(),subtree.tolist()):
+        bone.Nbchild=Nbchild
+        bone.Chainlength=Chainlength
+    return skeleton
+
+def ReadBone(mch):
+    header=mch.header
+    boneList=[]
+    print("bone Count from header:{}".format(header.BoneCount))
+    for parent,length in MCH_BONE.iter_unpack(mch.bones):
+        bone=MchBone_class()
+        #get parent.base 1 in mch
+        bone.parent=parent-1
+        #get length.All bone length are negative
+        bone.length=length
+        boneList.append(bone)
+
+    #nb of children and chain length(descendants count) come with BuildSkeleton
+    return boneList
+
+def BoneSequence(charname):
+    """Position of each BONE_NAMES entry in the MCH bone list of a character,"N" if the character has no such bone"""
+
+    #    #----------Associate BoneNames to a bone number-------#
+#    #test sequence
+#        BoneSequence=\
+#        [0,1,2,3,4,5,6,7,8,\
+#        9,10,11,12,13,14,15,16,17,\
+#        18,19,20,21,22,23,24,25,26,\
+#        27,28,29,30,31,32,33,34,35,\
+#        36,37,38,39,40,41,42,43,44,\
+#        45,46,47,48,49,50,51,52,53]
+
+    firstRow = [0,1,2,4,"N","N","N","N","N"]
+    secondRow = ["N",3,5,"N","N","N","N","N","N"]
+    thirdRow = [9,"N","N","N","N","N","N",8,10]
+    fifthRow = ["N","N","N","N",6,7,"N","N","N"]
+    sixthRow = ["N","N","N",11,12,15,16,19,20]
+
+    if charname in ["d022","d023","d024","d025","d026","d051","d075","d067","d061"]:#RINOA + Soldier/Spacesuit Rinoa
+        BoneSequence = firstRow + \
+        ["N",3,5,"N","N","N",6,12,18,\
+        10,16,22,27,29,30,31,9,11,\
+        15,17,21,23,26,28,"N","N","N",\
+        "N","N","N","N",7,8,"N","N","N",\
+        "N","N","N",13,14,19,20,24,25]
+
+    elif charname in ["d000","d001","d002","d003","d004","d005","d006","d007","d049","d052","d053","d060"]:#SQUALL + Spacesuit Squall
+        BoneSequence = firstRow + \
+        secondRow + \
+        thirdRow + \
+        [13,14,17,18,21,22,23,24,"N"] + \
+        fifthRow + \
+        sixthRow
+
+    elif charname in ["d027","d028","d029","d030", "d066"]:#SELPHIE + Soldier Selphie
+        BoneSequence = firstRow + \
+        secondRow + \
+        [9,14,19,"N","N","N","N",8,10,\
+        13,15,18,20,23,24,"N","N","N"] + \
+        fifthRow + \
+        ["N","N","N",11,12,16,17,21,22]
+
+    elif charname in ["d009","d010","d011","d012","d014", "d054","d055","d056","d057","d059", "d069"]:#ZELL + Kids + Soldier Zell
+        BoneSequence = firstRow + \
+        secondRow + \
+        thirdRow + \
+        [13,14,17,18,21,22,"N","N","N"] + \
+        fifthRow + \
+        sixthRow
+
+    elif charname in ["d015","d016","d017", "d070"]:#IRVINE + Soldier
+        BoneSequence = firstRow + \
+        ["N",3,6,5,11,"N","N","N","N",\
+        10,18,25,32,"N","N","N",9,14,\
+        17,21,24,28,31,33,19,"N",26,\
+        20,"N",27,"N",7,8,12,13,"N",\
+        "N","N","N",15,16,22,23,29,30]
+
+    elif charname in ["d018","d019","d020","d021","d050", "d068"]:#QUISTIS + Soldier Quistis
+        BoneSequence = firstRow + \
+        secondRow + \
+        [9,14,20,15,21,"N","N",8,10,\
+        13,16,19,22,25,26,"N","N","N"] + \
+        fifthRow + \
+        ["N","N","N",11,12,17,18,23,24]
+
+    elif charname in ["d040","d041","d042","d035","d074"]:#EDEA
+        BoneSequence = firstRow + \
+        ["N",3,5,9,12,"N","N","N","N",\
+        10,"N","N","N","N","N","N",8,11,\
+        15,16,19,20,23,24,"N","N","N"] + \
+        fifthRow + \
+        ["N","N","N",13,14,17,18,21,22]
+
+    elif charname in ["d058"]:#kid Quistis
+        BoneSequence = firstRow + \
+        secondRow + \
+        [9,14,"N","N","N","N",19,8,10,\
+        13,15,18,20,23,24,"N","N","N"] + \
+        fifthRow + \
+        ["N","N","N",11,12,16,17,21,22]
+
+    elif charname in ["d045","d046","d072", "d063"]:#KIROS + Spacesuit Kiros
+        BoneSequence = firstRow + \
+        ["N",3,5,28,32,34,27,31,33,\
+        9,14,19,26,30,21,20,8,10,\
+        13,15,18,22,25,29,"N","N","N"] + \
+        fifthRow + \
+        ["N","N","N",11,12,16,17,23,24]
+
+    elif charname in ["d047","d048","d073", "d064"]:#WARD + Spacesuit Ward
+        BoneSequence = firstRow + \
+        ["N",3,5,12,14,"N","N","N","N",\
+        9,"N","N","N","N","N","N",8,10,\
+        15,16,25,26,29,30,"N","N","N",\
+        "N","N","N","N",6,7,18,19,20,\
+        22,23,24,11,13,17,21,27,28]
+
+    elif charname in ["d032","d033","d034","d035","d036","d037","d065"]:#SEIFER
+        BoneSequence = \
+        [0,1,2,6,8,20,5,17,"N",\
+        "N",4,7,3,11,"N","N","N","N",\
+        18,"N","N","N","N","N","N",16,19,\
+        27,28,35,36,39,40,23,31,32,\
+        25,33,34,"N",9,10,12,14,13,\
+        24,15,26,21,22,29,30,37,38]
+
+    elif charname in ["d043","d044","d071", "d062"]:#LAGUNA + Spacesuit Laguna
+        BoneSequence = \
+        [0,1,2,4,12,19,9,16,"N",\
+        "N",3,5,"N","N","N","N","N","N",\
+        10,17,"N","N","N","N",23,8,11,\
+        15,18,22,24,27,28,"N","N","N"] + \
+        fifthRow + \
+        ["N","N","N",13,14,20,21,25,26]
+
+    else:
+        print("Unknown character.Default bone sequence")
+        BoneSequence=\
+        [0,1,2,3,4,5,6,7,8,\
+        9,10,11,12,13,14,15,16,17,\
+        18,19,20,21,22,23,24,25,26,\
+        27,28,29,30,31,32,33,34,35,\
+        36,37,38,39,40,41,42,43,44,\
+        45,46,47,48,49,50,51,52,53]
+
+    return BoneSequence
+
+def NameBones(boneList,charname):
+    """Give each bone of the list its BONE_NAMES name"""
+    sequence=BoneSequence(charname)
+    print("{} Bone names".format(len(BONE_NAMES)))
+    #sequence gives the bone of each name, "N" for none. The last name of a bone wins
+    for name,bone in zip(BONE_NAMES,sequence):
+        if isinstance(bone,int) and 0<=bone<len(boneList):
+            boneList[bone].name=name
+    return boneList
+
+def ReadRestPose(mch):
+    """Read the first frame of the MCH anim block:root offset (x,y,z) and the raw 2 bytes rotations of every bone"""
+    anim=MchAnim_class()
+    #frame count,bone count,offset
+    AnimCount,anim.frameCount,anim.boneCount,y,x,z=MCH_RESTPOSE.unpack_from(mch.anim,0)
+
+    anim.offsets=np.array([[x,y,z]],dtype=np.int16)
+    #rotations.On 2 bytes range is [-(0x10000-0x8000) , 0x8000], kept raw here
+    anim.rotations=np.frombuffer(mch.anim,dtype='<i2',count=mch.header.BoneCount*3,offset=MCH_RESTPOSE.size)\
+.reshape(1,mch.header.BoneCount,3).copy()
+
+    return anim
+
+def ModelScale(char_name,onescale,mchsize):
+    """Vertex divider of a model:chara.one scale times the remaster divider"""
+    SCALE=onescale
+    #check if FF8RE or FF8 by comparing file size.
+    isFF8RE=1
+    if mchsize>150000:# FF8RE mch file is >150ko
+        isFF8RE=1
+    if isFF8RE==1:
+        m_index=0
+        for m in ff8REmdiv:
+            if m[0]==char_name:
+                m_index=ff8REmdiv.index(m)
+                break
+    #IF you try to import a custom MCH ( heavier than a FFRe file, then #comment this section of the code
+        SCALE*=ff8REmdiv[m_index][1]
+    return SCALE
+
+def ReadVertices(mch,SCALE):
+    """(VCount,3) float32 array of the model vertices, divided by SCALE"""
+    #8 bytes records:x,y,z int16 then 2 unknown bytes, skipped by the stride
+    raw=np.ndarray((mch.header.VCount,3),dtype='<i2',buffer=mch.vertices,strides=(MCH_VERTEX.size,2))
+    return np.divide(raw,SCALE,dtype=np.float32)
+
+def ReadFaces(mch):
+    """Face table of the model(MchFaces_class) and its unique uv list. Faces point to the uvs with vt"""
+    table=np.frombuffer(mch.faces,dtype=MCH_FACE,count=mch.header.FCount)
+    faces=MchFaces_class()
+    faces.is_tri=table['is_tri']==0x25010607
+    faces.vertices=table['v'][:,BLENDER_CORNERS].astype(np.int32)
+    faces.texgroup=table['texgroup'].astype(np.int32)
+
+    uvs=table['uv'][:,BLENDER_CORNERS].astype(np.int32)
+    #invert V coordinate
+    uvs[:,:,1]=128-uvs[:,:,1]
+    #offset uvs by texture group
+    uvs[:,:,0]+=(faces.texgroup//2)[:,None]*128
+    uvs[:,:,1]+=(faces.texgroup%2)[:,None]*128
+    faces.uvs=uvs
+
+    #associate uvs to faces
+    ##remove redundant uvs, vt is the index of each corner in the unique list
+    print("UV count before filter:",uvs.shape[0]*4)
+    UVlist,vt=np.unique(uvs.reshape(-1,2),axis=0,return_inverse=True)
+    faces.vt=vt.reshape(-1,4).astype(np.int32)
+    print("UV count after filter:",len(UVlist))
+
+    return faces,UVlist
+
+def WeldUVs(UVlist,vt,threshold,used=None):
+    """Merge the uvs closer than threshold(uv space, 1.0 is one 128 pixels texture group), like bpy.ops.uv.remove_doubles:
+    every uv not merged yet takes the other ones in range, then the group moves to its average.
+    used(bool mask like vt) gives the real face corners, uvs of unused corners only(4th corner of triangles) are left alone.
+    Returns the new unique uv list(float pixels) and vt"""
+    points=np.asarray(UVlist,dtype=np.float64)
+    if threshold<=0 or len(points)==0:
+        return points.astype(np.float32),vt
+    if used is None:
+        used=np.ones(vt.shape,dtype=bool)
+    real=np.zeros(len(points),dtype=bool)
+    real[vt[used]]=True
+    limit=threshold*128
+    #grid hash of the real uvs, only the 3x3 neighbour cells can be in range
+    cells=np.floor(points/limit).astype(np.int64).tolist()
+    grid={}
+    for i in np.flatnonzero(real).tolist():
+        grid.setdefault(tuple(cells[i]),[]).append(i)
+
+    group=np.where(real,-1,np.arange(len(points)))
+    for i,(cx,cy) in enumerate(cells):
+        if group[i]!=-1:
+            continue
+        candidates=np.array([j for dx in (-1,0,1) for dy in (-1,0,1) for j in grid.get((cx+dx,cy+dy),())])
+        candidates=candidates[group[candidates]==-1]
+        delta=points[candidates]-points[i]
+        group[candidates[(delta*delta).sum(axis=1)<=limit*limit]]=i
+
+    #average of each group, weighted by the number of face corners using the uv
+    weights=np.bincount(vt[used],minlength=len(points)).astype(np.float64)
+    groups,newindex=np.unique(group,return_inverse=True)
+    newindex=newindex.ravel()
+    total=np.bincount(newindex,weights=weights,minlength=len(groups))
+    welded=np.empty((len(groups),2),dtype=np.float64)
+    for axis in range(2):
+        welded[:,axis]=np.bincount(newindex,weights=weights*points[:,axis],minlength=len(groups))
+    #unused uvs keep their own position
+    welded[total>0]/=total[total>0,None]
+    welded[total==0]=points[groups[total==0]]
+    print("UV count after weld:",len(welded))
+    return welded.astype(np.float32),newindex[vt].astype(np.int32)
+
+def ReadSkins(mch,boneList):
+    """Skin groups of the model, named after their bone"""
+    skinGroups=[]
+    for vertexFirst,vertexCount,bone in MCH_SKIN.iter_unpack(mch.skins):
+        skin=MchSkin_class()
+        #fist vertex base 0
+        skin.vertexFirst=vertexFirst
+        skin.vertexCount=vertexCount
+        #bone base 1
+        skin.bone=bone-1
+
+        skin.name=boneList[skin.bone].name
+
+        skinGroups.append(skin)
+    return skinGroups
+
+def DecodeModel(mch,char_name,onescale=0x100):
+    """Decode a whole MchFile:header, named bones, rest pose, vertices, faces, uvs, skin groups and textures"""
+    model=MchModel_class()
+    model.header=mch.header
+    model.header.char_name=char_name
+    model.scale=ModelScale(char_name,onescale,len(mch.data))
+
+    model.boneList=NameBones(ReadBone(mch),char_name)
+    model.skeleton=BuildSkeleton(model.boneList)
+    model.restPose=ReadRestPose(mch)
+    model.Vlist=ReadVertices(mch,model.scale)
+    model.faces,model.UVlist=ReadFaces(mch)
+    model.skinGroups=ReadSkins(mch,model.boneList)
+    model.textures=ReadTextures(mch)
+    return model
+
+def ReadModel(filepath,onescale=0x100):
+    """Decode a whole .mch file(DecodeModel)"""
+    char_name=os.path.basename(filepath).split('.mch')[0]
+    with MchFile(filepath) as mch:
+        model=DecodeModel(mch,char_name,onescale)
+
+    return model
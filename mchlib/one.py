@@ -0,0 +1,221 @@
+#*****************************************************************************#
+#    Copyright (C) 2024 Shunsq                                                #
+#    Copyright (C) 2024 Julian Xhokaxhiu                                      #
+#                                                                             #
+#    This file is part of FF8 MCH                                             #
+#                                                                             #
+#    FF8 MCH is free software: you can redistribute it and/or modify          #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License            #
+#                                                                             #
+#    FF8 MCH is distributed in the hope that it will be useful,               #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#*****************************************************************************#
+
+"""***********************************************
+*********chara.one parsing (no bpy)***************
+**********************************************"""
+import os,struct
+import numpy as np
+from .mch import MchAnim_class,MchFile,DecodeModel
+
+class MchAlone_class:
+    """Class defining a chara.one character, I call it "alone"
+        -Address(4 bytes)
+        -Size(4 bytes x2)
+        -hasTim(4 bytes)#tim textures if NPC.<=0xd0000000 if hasTim=1.
+            -TimOffset(4bytes) list ended by 0xFFFFFFFF if hasTim=1
+        -ModelOffsetfset#address of the mesh in chara.one
+        -name(4 chars)
+        -unk1 bytes(4 bytes)
+        -0xeeeeeeee
+    and what the index adds:
+        -TableOffset#address of the entry in the character table
+        -Scale#2 bytes, 7 bytes before the name
+        -AnimAddress#anim count then the acts
+        -AnimCount"""
+    def __init__(self) :#constructor
+        self.name=''
+        self.Address=0
+        self.Size=0
+        self.hasTim=0
+        self.TimOffset=0
+        self.TimOffsets=[]
+        self.ModelOffset=0
+        self.TableOffset=0
+        self.Scale=0
+        self.AnimAddress=0
+        self.AnimCount=0
+    def __repr__(self):
+        return("name{} address:{} size:{} hasTim:{} timoffset:{} ModelOffset:{} scale:{} AnimAddress:{} AnimCount:{}\n"\
+.format(self.name,hex(self.Address),hex(self.Size),hex(self.hasTim),hex(self.TimOffset),hex(self.ModelOffset),hex(self.Scale),hex(self.AnimAddress),hex(self.AnimCount)))
+
+def ReadCharaOne(onefile):
+    """List of the characters of a chara.one, with their scale and anim count"""
+    onefile.seek(0,0)
+    charCount=int.from_bytes(onefile.read(4), byteorder='little')
+    print("{} characters".format(charCount))
+    aloneList=[]
+    namePos=[]
+    for i in range(0,charCount):
+        alone=MchAlone_class()
+        alone.TableOffset=onefile.tell()
+        alone.Address=int.from_bytes(onefile.read(4), byteorder='little')+4#offset just after the character count so we add 4 for the absolute offset
+        alone.Size=int.from_bytes(onefile.read(4), byteorder='little')
+        onefile.seek(4,1)
+        alone.hasTim=int.from_bytes(onefile.read(4), byteorder='little')
+        if alone.hasTim<=0xd0000000:  #if has<=0xd0000000 then it's a NPC with textures
+            #0xFFFFFFFF is end code for textures. So it is possible to have 2 textures, or even more
+            while True:
+                timoffset=onefile.read(4)
+                if len(timoffset)<4 or timoffset==b'\xff\xff\xff\xff':
+                    break
+                alone.TimOffsets.append(int.from_bytes(timoffset, byteorder='little'))
+            if alone.TimOffsets:
+                alone.TimOffset=alone.TimOffsets[0]
+        alone.ModelOffset=int.from_bytes(onefile.read(4), byteorder='little')
+        namePos.append(onefile.tell())
+        alone.name=onefile.read(4).decode(encoding="cp437")
+        onefile.seek(8,1)
+        aloneList.append(alone)
+
+    for alone,pos in zip(aloneList,namePos):
+        #go back 7 bytes to read the character scale
+        onefile.seek(pos-7,0)
+        alone.Scale=int.from_bytes(onefile.read(2), byteorder='little')
+        if alone.hasTim<=0xd0000000:
+            #NPC:the acts are in the anim section of the model stored after the textures
+            onefile.seek(alone.Address+alone.ModelOffset+0x38,0)#AnimOffset in the MCH header
+            alone.AnimAddress=alone.Address+alone.ModelOffset+int.from_bytes(onefile.read(4), byteorder='little')
+        else:
+            alone.AnimAddress=alone.Address
+        onefile.seek(alone.AnimAddress,0)
+        alone.AnimCount=int.from_bytes(onefile.read(2), byteorder='little')
+    return aloneList
+
+_CHARA_ONE_INDEX={}#path:((mtime,size),index)
+
+def CharaOneIndex(onepath):
+    """Characters of a chara.one by name(MchAlone_class). The file is parsed again only when its mtime or size change"""
+    stat=os.stat(onepath)
+    version=(stat.st_mtime_ns,stat.st_size)
+    path=os.path.abspath(onepath)
+    cached=_CHARA_ONE_INDEX.get(path)
+    if cached is None or cached[0]!=version:
+        index={}
+        with open(onepath,"rb") as onefile:
+            for alone in ReadCharaOne(onefile):
+                index.setdefault(alone.name,alone)#first one wins
+        cached=_CHARA_ONE_INDEX[path]=(version,index)
+    return cached[1]
+
+def ReadScale(onepath,char_name):
+    """Character scale stored in chara.one, None if the chara.one doesn't contain char_name"""
+    alone=CharaOneIndex(onepath).get(char_name)
+    if alone is None:
+        return None
+    return alone.Scale
+
+def ReadNpcModel(block,alone):
+    """Decode the model of a NPC(MchModel_class), None for a main character. block holds the alone.Size bytes at alone.Address.
+    The NPC block is the TIMs then the model at ModelOffset, the texture table is the table entry:hasTim then TimOffsets"""
+    if alone.hasTim>0xd0000000:#main character, the model is a .mch file
+        return None
+    with MchFile(block,alone.ModelOffset) as mch:
+        mch.TexOffsets=[texoffset&0xffffff for texoffset in [alone.hasTim]+alone.TimOffsets]
+        model=DecodeModel(mch,alone.name,alone.Scale/0x10)
+    return model
+
+def ReadActHeaders(onefile,alone):
+    """List of the acts of a character(MchAnim_class), only the frame and bone counts are read:
+    the frames are skipped and left undecoded"""
+    onefile.seek(alone.AnimAddress,0)
+    #anim count
+    alone.AnimCount=int.from_bytes(onefile.read(2),byteorder='little')
+
+    actList=[]
+    for i in range(0,alone.AnimCount):
+        anim=MchAnim_class()
+        anim.name=alone.name+"_act{}".format(i)
+        anim.oneAddress=onefile.tell()
+        anim.frameCount=int.from_bytes(onefile.read(2),byteorder='little')
+        anim.boneCount=int.from_bytes(onefile.read(2),byteorder='little')
+        #a frame is the root offset y,x,z(3 int16) then 4 bytes per bone
+        onefile.seek(anim.frameCount*(6+4*anim.boneCount),1)
+        actList.append(anim)
+    return actList
+
+def DecodeAct(onefile,anim):
+    """Decode the frames of an act listed by ReadActHeaders in a single pass into its offset and rotation arrays"""
+    onefile.seek(anim.oneAddress+4,0)
+    framesize=6+4*anim.boneCount
+    frames=np.frombuffer(onefile.read(anim.frameCount*framesize),dtype=np.uint8).reshape(anim.frameCount,framesize)
+
+    anim.offsets=np.ascontiguousarray(frames[:,:6]).view('<i2')[:,[1,0,2]].astype(np.int16)
+
+    #Vehek 2 qhimm:3 rotations of 10 bits, low bytes first then the high bits packed in byte 4
+    byte_1,byte_2,byte_3,byte_4=frames[:,6:].reshape(anim.frameCount,anim.boneCount,4).astype(np.int16).transpose(2,0,1)
+    rotations=np.empty((anim.frameCount,anim.boneCount,3),dtype=np.int16)
+    rotations[...,0]=(byte_2|((byte_4&0xc)<<6))<<2#rotX
+    rotations[...,1]=(byte_3|((byte_4&0x30)<<4))<<2#rotY
+    rotations[...,2]=(byte_1|((byte_4&3)<<8))<<2#rotZ
+    #12 bits signed:[0x800,0x1000[ is negative
+    rotations-=(rotations&0x800)<<1
+    anim.rotations=rotations
+    return anim
+
+def EncodeAct(anim):
+    """Bytes of an act in chara.one:frame and bone counts then the frames, the inverse of DecodeAct.
+    Rotations keep their 10 high bits"""
+    frameCount,boneCount=anim.rotations.shape[:2]
+    frames=np.empty((frameCount,6+4*boneCount),dtype=np.uint8)
+    frames[:,:6]=np.ascontiguousarray(anim.offsets[:,[1,0,2]],dtype='<i2').view(np.uint8)
+    rotX,rotY,rotZ=((anim.rotations.astype(np.int32)>>2)&0x3ff).transpose(2,0,1)
+    packed=frames[:,6:].reshape(frameCount,boneCount,4)
+    packed[...,0]=rotZ&0xff
+    packed[...,1]=rotX&0xff
+    packed[...,2]=rotY&0xff
+    packed[...,3]=(rotZ>>8)|((rotX>>8)<<2)|((rotY>>8)<<4)
+    return struct.pack('<HH',frameCount,boneCount)+frames.tobytes()
+
+def EncodeAnims(animList):
+    """Bytes of the anim section of a character:anim count then the acts"""
+    return b''.join([struct.pack('<H',len(animList))]+[EncodeAct(anim) for anim in animList])
+
+def WriteAnims(onepath,outpath,char_name,animList):
+    """Write a copy of the chara.one onepath to outpath where the acts of char_name are animList.
+    The characters stored after it are moved and the table(addresses and sizes) is updated"""
+    alone=CharaOneIndex(onepath).get(char_name)
+    if alone is None:
+        raise ValueError("no {} in {}".format(char_name,onepath))
+    with open(onepath,"rb") as onefile:
+        data=bytearray(onefile.read())
+        aloneList=ReadCharaOne(onefile)
+        ReadActHeaders(onefile,alone)
+        animEnd=onefile.tell()
+
+    anims=EncodeAnims(animList)
+    delta=len(anims)-(animEnd-alone.AnimAddress)
+    anims+=bytes(-delta%4)#the next characters stay 4 bytes aligned
+    delta+=-delta%4
+    data[alone.AnimAddress:animEnd]=anims
+
+    for other in aloneList:
+        if other.Address>alone.Address:
+            struct.pack_into('<I',data,other.TableOffset,other.Address+delta-4)
+        elif other.Address==alone.Address:
+            struct.pack_into('<II',data,other.TableOffset+4,other.Size+delta,other.Size+delta)#size is written twice
+    with open(outpath,"wb") as outputfile:
+        outputfile.write(data)
+    return delta
+
+def ReadAnims(onefile,alone):
+    """Returns a list of animations(MchAnim_class), each one decoded in a single pass into offset and rotation arrays."""
+    animList=ReadActHeaders(onefile,alone)
+    print("AnimCount:{}".format(alone.AnimCount))
+    for anim in animList:
+        print ("frameCount:{} boneCount:{}".format(anim.frameCount,anim.boneCount))
+        DecodeAct(onefile,anim)
+    return animList
@@ -0,0 +1,315 @@
+#*****************************************************************************#
+#    Copyright (C) 2024 Shunsq                                                #
+#    Copyright (C) 2024 Julian Xhokaxhiu                                      #
+#                                                                             #
+#    This file is part of FF8 MCH                                             #
+#                                                                             #
+#    FF8 MCH is free software: you can redistribute it and/or modify          #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License            #
+#                                                                             #
+#    FF8 MCH is distributed in the hope that it will be useful,               #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#*****************************************************************************#
+
+"""***********************************************
+*********Skeleton and retarget maths (no bpy)*****
+**********************************************"""
+import math
+import numpy as np
+
+#Matrices are row major numpy arrays:(...,3,3) rotations and (...,4,4) armature space bone matrices
+#like blender matrix_local. Frames are the first axis, bones the second one.
+#Bones are sorted parent first, the root parent is -1.
+
+#blender rotation orders:axis i,j,k and parity
+ROTATION_ORDERS={
+    'XYZ':(0,1,2,False),
+    'XZY':(0,2,1,True),
+    'YXZ':(1,0,2,True),
+    'YZX':(1,2,0,False),
+    'ZXY':(2,0,1,False),
+    'ZYX':(2,1,0,True)}
+
+def EulerToMatrix(eulers,order='YXZ'):
+    """(...,3) euler angles to (...,3,3) rotation matrices, same convention as mathutils(first axis of order applied first)"""
+    eulers=np.asarray(eulers,dtype=np.float64)
+    cos=np.cos(eulers)
+    sin=np.sin(eulers)
+    mats=np.broadcast_to(np.eye(3),eulers.shape+(3,)).copy()
+    for axis in order:
+        a=ord(axis)-ord('X')
+        b,c=[(1,2),(2,0),(0,1)][a]
+        rot=np.zeros(eulers.shape[:-1]+(3,3))
+        rot[...,a,a]=1
+        rot[...,b,b]=cos[...,a]
+        rot[...,c,c]=cos[...,a]
+        rot[...,b,c]=-sin[...,a]
+        rot[...,c,b]=sin[...,a]
+        mats=rot@mats
+    return mats
+
+def CompatibleEuler(eulers,old):
+    """Wrap eulers by 2pi to be as close as possible to old, like blender compatible_eul(same thresholds)"""
+    eulers=np.array(eulers,dtype=np.float64)
+    old=np.broadcast_to(old,eulers.shape)
+    delta=eulers-old
+    #differences around 360 degrees first, blender uses 5.1 instead of pi
+    far=np.abs(delta)>5.1
+    eulers[far]-=np.floor(np.abs(delta[far])/(2*math.pi)+0.5)*2*math.pi*np.sign(delta[far])
+    delta=eulers-old
+    #then an axis over 180 degrees while the others are under 90 degrees(3.2 and 1.6 in blender)
+    for i,j,k in ((0,1,2),(1,2,0),(2,0,1)):
+        flip=(np.abs(delta[...,i])>3.2)&(np.abs(delta[...,j])<1.6)&(np.abs(delta[...,k])<1.6)
+        eulers[...,i]-=np.where(flip,np.sign(delta[...,i])*2*math.pi,0)
+    return eulers
+
+def MatrixToEuler(mats,order='YXZ',old=None):
+    """(...,3,3) rotation matrices to (...,3) euler angles.
+    Both euler solutions are made compatible with old and the closest one is kept(blender mat3_normalized_to_compatible_eulO)"""
+    mats=np.asarray(mats,dtype=np.float64)
+    i,j,k,parity=ROTATION_ORDERS[order]
+    cy=np.hypot(mats[...,i,i],mats[...,j,i])
+    eul1=np.empty(mats.shape[:-1])
+    eul2=np.empty(mats.shape[:-1])
+    eul1[...,i]=np.arctan2(mats[...,k,j],mats[...,k,k])
+    eul1[...,j]=np.arctan2(-mats[...,k,i],cy)
+    eul1[...,k]=np.arctan2(mats[...,j,i],mats[...,i,i])
+    eul2[...,i]=np.arctan2(-mats[...,k,j],-mats[...,k,k])
+    eul2[...,j]=np.arctan2(-mats[...,k,i],-cy)
+    eul2[...,k]=np.arctan2(-mats[...,j,i],-mats[...,i,i])
+    #gimbal lock
+    lock=cy<=16*np.finfo(np.float32).eps
+    eul1[lock,i]=np.arctan2(-mats[lock,j,k],mats[lock,j,j])
+    eul1[lock,k]=0
+    eul2[lock]=eul1[lock]
+    if parity:
+        eul1=-eul1
+        eul2=-eul2
+    if old is None:
+        return eul1
+    eul1=CompatibleEuler(eul1,old)
+    eul2=CompatibleEuler(eul2,old)
+    d1=np.abs(eul1-old).sum(axis=-1)
+    d2=np.abs(eul2-old).sum(axis=-1)
+    return np.where((d1>d2)[...,None],eul2,eul1)
+
+def ContinuousEuler(mats,order='YXZ',old=None):
+    """(frames,...,3,3) rotation matrices to euler angles, each frame compatible with the previous one.
+    The first frame is compatible with old(zero by default)"""
+    eulers=np.empty(mats.shape[:-1])
+    old=np.zeros(mats.shape[1:-1]) if old is None else old
+    for frame in range(len(mats)):
+        old=eulers[frame]=MatrixToEuler(mats[frame],order,old)
+    return eulers
+
+def RawEulers(anim):
+    """(frames,bones,3) YXZ euler rotations of a MchAnim_class on the raw armature, Euler([-rX,-rY,rZ],'YXZ').
+    BEWARE--ROTATION ARE ALONG PARENT BONE AXIS, NOT CURRENT BONE LOCAL AXIS"""
+    eulers=math.pi*anim.rotations/0x800*np.array([-1,-1,1])
+    eulers[:,0]=0#root only moves
+    return eulers
+
+def RawLocations(anim,root_length):
+    """(frames,3) root location of a MchAnim_class on the raw armature.
+    In pose mode Y is along bone direction, Z is forward"""
+    offsets=anim.offsets/256
+    return np.stack((offsets[:,0],offsets[:,2]-root_length/256,offsets[:,1]),axis=1)
+
+def PoseMatrices(rest,parents,rotations,locations):
+    """(frames,bones,4,4) pose matrices, armature space, from the rest matrices,
+    the local rotations(frames,bones,3,3) and the root locations(frames,3)"""
+    frames,bones=rotations.shape[:2]
+    local=np.broadcast_to(np.eye(4),(frames,bones,4,4)).copy()
+    local[...,:3,:3]=rotations
+    local[:,0,:3,3]=locations
+    pose=np.empty_like(local)
+    for bone,parent in enumerate(parents):
+        if parent<0:
+            pose[:,bone]=rest[bone]@local[:,bone]
+        else:
+            pose[:,bone]=pose[:,parent]@(np.linalg.inv(rest[parent])@rest[bone])@local[:,bone]
+    return pose
+
+def PoseRotations(rest,parents,rotations):
+    """(frames,bones,3,3) armature space rotations of the posed bones, from the local rotations"""
+    rest=rest[:,:3,:3]
+    world=np.empty_like(rotations)
+    for bone,parent in enumerate(parents):
+        if parent<0:
+            world[:,bone]=rest[bone]@rotations[:,bone]
+        else:
+            world[:,bone]=world[:,parent]@(rest[parent].T@rest[bone])@rotations[:,bone]
+    return world
+
+def RetargetPose(rest,parents,world,heads):
+    """Local rotations(frames,bones,3,3) and root locations(frames,3) giving the bones of an armature(rest matrices)
+    the armature space rotations world(frames,bones,3,3) and the root head positions heads(frames,3)"""
+    rot=rest[:,:3,:3]
+    local=np.empty_like(world)
+    for bone,parent in enumerate(parents):
+        if parent<0:
+            local[:,bone]=rot[bone].T@world[:,bone]
+        else:
+            local[:,bone]=(rot[bone].T@rot[parent])@np.swapaxes(world[:,parent],-1,-2)@world[:,bone]
+    locations=(heads-rest[0,:3,3])@rot[0]#rot0^T @ (head - rest head), row vectors
+    return local,locations
+
+def RetargetAnim(raw_rest,rest,parents,anim,root_length):
+    """Retarget a MchAnim_class from the raw armature to an armature with the same bones:
+    every bone gets the armature space rotation of the raw bone and the root gets the raw root position.
+    Returns the local rotations(frames,bones,3,3) and root locations(frames,3)"""
+    raw=EulerToMatrix(RawEulers(anim))
+    world=PoseRotations(raw_rest,parents,raw)
+    #raw root head:rest head moved by the location in the root bone space
+    heads=raw_rest[0,:3,3]+RawLocations(anim,root_length)@raw_rest[0,:3,:3].T
+    return RetargetPose(rest,parents,world,heads)
+
+def QuaternionToMatrix(quats):
+    """(...,4) w,x,y,z quaternions to (...,3,3) rotation matrices, quaternions are normalized first"""
+    quats=np.asarray(quats,dtype=np.float64)
+    w,x,y,z=np.moveaxis(quats/np.linalg.norm(quats,axis=-1,keepdims=True),-1,0)
+    return np.stack((
+        np.stack((1-2*(y*y+z*z),2*(x*y-w*z),2*(x*z+w*y)),axis=-1),
+        np.stack((2*(x*y+w*z),1-2*(x*x+z*z),2*(y*z-w*x)),axis=-1),
+        np.stack((2*(x*z-w*y),2*(y*z+w*x),1-2*(x*x+y*y)),axis=-1)),axis=-2)
+
+def RetargetToRaw(raw_rest,rest,parents,rotations,locations,root_length):
+    """Inverse of RetargetAnim:the pose given by the local rotations(frames,bones,3,3) and root locations(frames,3)
+    of an armature(rest matrices) brought back on the raw armature.
+    Returns the int16 offsets(frames,3) and rotations(frames,bones,3) of a MchAnim_class, rotations rounded to the 10 bits of chara.one"""
+    world=PoseRotations(rest,parents,rotations)
+    heads=rest[0,:3,3]+locations@rest[0,:3,:3].T
+    raw,raw_locations=RetargetPose(raw_rest,parents,world,heads)
+    #inverse of RawEulers:Euler([-rX,-rY,rZ],'YXZ'), 0x800 is pi
+    eulers=ContinuousEuler(raw,'YXZ')*np.array([-1,-1,1])
+    steps=np.round(eulers*0x200/math.pi).astype(np.int64)
+    steps=((steps+0x200)&0x3ff)-0x200#10 bits signed
+    anim_rotations=(steps<<2).astype(np.int16)
+    #inverse of RawLocations
+    offsets=np.stack((raw_locations[:,0]*256,raw_locations[:,2]*256,raw_locations[:,1]*256+root_length),axis=1)
+    anim_offsets=np.clip(np.round(offsets),-0x8000,0x7fff).astype(np.int16)
+    return anim_offsets,anim_rotations
+
+def ReduceKeys(values,tolerance):
+    """Keys to keep(bool mask like values) so that linear interpolation between kept keys reproduces
+    values(frames,channels) within tolerance. All channels are split at once, Douglas-Peucker like:
+    each segment still too far gets a key at its farthest frame. The first and last frames are always kept"""
+    values=np.asarray(values,dtype=np.float64)
+    frameCount=len(values)
+    keep=np.zeros(values.shape,dtype=bool)
+    keep[[0,-1]]=True
+    if frameCount<3:
+        keep[:]=True
+        return keep
+    frames=np.arange(frameCount)[:,None]
+    channels=np.broadcast_to(np.arange(values.shape[1]),values.shape)
+    while True:
+        #previous and next kept key of every frame, per channel
+        before=np.maximum.accumulate(np.where(keep,frames,0),axis=0)
+        after=np.minimum.accumulate(np.where(keep,frames,frameCount-1)[::-1],axis=0)[::-1]
+        span=np.maximum(after-before,1)
+        lerp=values[before,channels]+(values[after,channels]-values[before,channels])*(frames-before)/span
+        error=np.abs(lerp-values)
+        if not (error>tolerance).any():
+            return keep
+        #farthest frame of each segment(segments are named after their first key)
+        farthest=np.zeros(values.shape)
+        np.maximum.at(farthest,(before,channels),error)
+        keep|=(error>tolerance)&(error==farthest[before,channels])
+
+#raw armature of each character group:root bone direction, armature object rotation(applied)
+#and upperbody/lowerbody pose rotation(applied as rest pose) before computing the delta rotations
+RAW_ROOT_X=("d000","d001","d002","d003","d004","d005","d006","d007",
+    "d009","d010","d011","d012","d014","d060","d069",
+    "d018","d019","d020","d021","d068","d022","d023","d024","d025",
+    "d026","d061","d067","d047","d048","d064","d073","d049","d050","d051","d052","d053","d075",
+    "d032","d033","d034","d035","d036","d037","d065",
+    "d054","d055","d056","d057","d058","d059",
+    "d040","d041","d042","d074")
+RAW_ROOT_Y=("d015","d016","d017","d027","d028","d029","d030")
+
+def RawProfile(char_name):
+    """Root direction(3), object rotation(3,3) and body pose rotation(3,3, None if unused) of the raw armature of char_name"""
+    if char_name in RAW_ROOT_X:
+        #rotate_axis Y 90 then X 90, rotations are local:Ry@Rx
+        return ((-1,0,0),EulerToMatrix((0,math.pi/2,0),'XYZ')@EulerToMatrix((math.pi/2,0,0),'XYZ'),
+            EulerToMatrix((math.pi/2,0,-math.pi/2),'YXZ'))
+    if char_name in RAW_ROOT_Y:
+        return ((0,-1,0),EulerToMatrix((-math.pi/2,0,0),'XYZ')@EulerToMatrix((0,math.pi/2,0),'XYZ'),
+            EulerToMatrix((0,-math.pi/2,math.pi/2),'YXZ'))
+    return ((0,0,1),np.eye(3),None)
+
+def VectorRollToMatrix(vectors,rolls):
+    """(...,3,3) rotations of bones along vectors(...,3) with rolls(...), blender vec_roll_to_mat3:
+    Y follows the bone, the roll turns it around Y"""
+    vectors=np.asarray(vectors,dtype=np.float64)
+    norm=np.linalg.norm(vectors,axis=-1,keepdims=True)
+    nor=np.where(norm>0,vectors/np.where(norm>0,norm,1),(0,1,0))
+    x,y,z=np.moveaxis(nor,-1,0)
+    theta=1+y
+    theta_alt=x*x+z*z
+    #close to -Y:series of 1+y, on -Y:half turn around Z
+    degenerate=(theta<=6.1e-3)&(theta_alt<=2.5e-4**2)
+    theta=np.where(theta>6.1e-3,theta,theta_alt*0.5+theta_alt*theta_alt*0.125)
+    theta=np.where(degenerate,1,theta)
+    mats=np.stack((
+        np.stack((1-x*x/theta,x,-x*z/theta),axis=-1),
+        np.stack((-x,y,-z),axis=-1),
+        np.stack((-x*z/theta,z,1-z*z/theta),axis=-1)),axis=-2)
+    mats[degenerate]=np.diag((-1.,-1.,1.))
+    #roll:axis angle around the bone
+    rolls=np.asarray(rolls,dtype=np.float64)
+    cos=np.cos(rolls)[...,None,None]
+    sin=np.sin(rolls)[...,None,None]
+    axis=mats[...,:,1]
+    cross=np.zeros(axis.shape+(3,))
+    cross[...,0,1]=-axis[...,2]
+    cross[...,0,2]=axis[...,1]
+    cross[...,1,0]=axis[...,2]
+    cross[...,1,2]=-axis[...,0]
+    cross[...,2,0]=-axis[...,1]
+    cross[...,2,1]=axis[...,0]
+    roll=cos*np.eye(3)+sin*cross+(1-cos)*axis[...,:,None]*axis[...,None,:]
+    return roll@mats
+
+def RawRest(parents,lengths,char_name):
+    """(bones,4,4) rest matrices of the raw armature:connected bones with a 90 degrees roll,
+    the root along the profile direction and the others along Z, lengths/256, object rotation applied"""
+    root_vec,obj_rot=RawProfile(char_name)[:2]
+    vectors=np.zeros((len(parents),3))
+    vectors[:]=(0,0,1)
+    vectors[0]=root_vec
+    vectors*=np.asarray(lengths,dtype=np.float64)[:,None]/256
+    rest=np.broadcast_to(np.eye(4),(len(parents),4,4)).copy()
+    rest[:,:3,:3]=obj_rot@VectorRollToMatrix(vectors,math.pi/2)
+    for bone,parent in enumerate(parents):
+        if parent>=0:
+            rest[bone,:3,3]=rest[parent,:3,3]+obj_rot@vectors[parent]
+    return rest
+
+_RAW_RESTS={}#skeleton profile:(raw rest,raw rest with the body pose applied)
+
+def RawRests(parents,lengths,names,char_name):
+    """Raw rest matrices(bones,4,4) and the same with the upperbody/lowerbody pose applied as rest pose,
+    computed once per skeleton profile(character group, parents, lengths and names). Returned arrays are read only"""
+    key=(char_name in RAW_ROOT_X,char_name in RAW_ROOT_Y,tuple(parents),tuple(float(l) for l in lengths),tuple(names))
+    if key not in _RAW_RESTS:
+        raw_rest=RawRest(parents,lengths,char_name)
+        body_rot=RawProfile(char_name)[2]
+        rotations=np.broadcast_to(np.eye(3),(1,len(parents),3,3)).copy()
+        if body_rot is not None:
+            for bone,name in enumerate(names):
+                if name in ("upperbody","lowerbody"):
+                    rotations[0,bone]=body_rot
+        raw_bind=PoseMatrices(raw_rest,parents,rotations,np.zeros((1,3)))[0]
+        raw_rest.setflags(write=False)
+        raw_bind.setflags(write=False)
+        _RAW_RESTS[key]=(raw_rest,raw_bind)
+    return _RAW_RESTS[key]
+
+def DeltaRotations(raw_bind,rest):
+    """(bones,3,3) rotations from the raw bone rest matrices raw_bind to the bone rest matrices rest"""
+    return rest[:,:3,:3]@np.swapaxes(raw_bind[:,:3,:3],-1,-2)
@@ -0,0 +1,162 @@
+#*****************************************************************************#
+#    Copyright (C) 2024 Shunsq                                                #
+#    Copyright (C) 2024 Julian Xhokaxhiu                                      #
+#                                                                             #
+#    This file is part of FF8 MCH                                             #
+#                                                                             #
+#    FF8 MCH is free software: you can redistribute it and/or modify          #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License            #
+#                                                                             #
+#    FF8 MCH is distributed in the hope that it will be useful,               #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#*****************************************************************************#
+
+"""***********************************************
+*********PSX TIM texture decoding (no bpy)********
+**********************************************"""
+import struct
+import numpy as np
+
+TIM_MAGIC=0x10
+TIM_4BIT=0
+TIM_8BIT=1
+TIM_16BIT=2
+TIM_24BIT=3
+TIM_HAS_CLUT=0x08
+TIM_BLOCK=struct.Struct('<I4H')#size,x,y,pixH,pixV
+
+class CLUT_class:
+    """Class defining a CLUT ( image or palette)
+    uint32_t CLUT_imagesize;//(4bytes) size in bytes including the header
+    uint16_t CLUT_x;//(2bytes)localisation on the cache
+    uint16_t CLUT_y;//(2bytes)localisation on the cache
+    uint16_t CLUT_pixH;//(2bytes)sizeX in pixel ( X4 for 4-bit , X2 for 8-bit, X1 for 16-bit, x2/3 for 24-bit)
+    uint16_t CLUT_pixV;//(2bytes)sizeY in pixel
+    /*--here starts the colors(2bytes for TIM an 4bytes for BMP)*/"""
+
+    def __init__(self) :#constructor
+        self.imagesize=0
+        self.x=0
+        self.y=0
+        self.pixH=0
+        self.pixV=0
+    def __repr__(self):#print
+        return ("Size:{} bytes  x:{} y:{} pixH:{} pixV:{}\n".format(
+        self.imagesize,
+        self.x,
+        self.y,
+        self.pixH,
+        self.pixV))
+
+class TimImage_class:
+    """Class defining a TIM texture, still in its PSX encoding
+        -colordepth#file format(4bytes):
+            0x08 for 4-bits indexed(16 colors)
+            0x09 for 8-bits indexed(256 colors)
+            0x02 for 16-bits true color(no palette)
+            0x03 for 24-bits true color(no palette)
+        -palette#CLUT_class header, None without palette
+        -colors#(palette.pixV,palette.pixH) uint16 ABGR1555, one CLUT per row
+        -image#CLUT_class header of the pixel block
+        -width,height#in real pixels
+        -texels#(height,width) indices or ABGR1555 colors, (height,width,3) RGB bytes for 24-bit"""
+    def __init__(self) :#constructor
+        self.colordepth=0
+        self.palette=None
+        self.colors=None
+        self.image=CLUT_class()
+        self.width=0
+        self.height=0
+        self.texels=None
+    def __repr__(self):
+        return("colordepth:{} {}x{} cluts:{}\n"\
+.format(hex(self.colordepth),self.width,self.height,0 if self.colors is None else len(self.colors)))
+
+    def rgba(self,clut_row=0):
+        """(height,width,4) float32 RGBA, first line on top. Indexed images use the CLUT row clut_row"""
+        if self.colordepth&7==TIM_24BIT:
+            pixels=np.ones((self.height,self.width,4),dtype=np.float32)
+            pixels[...,:3]=self.texels/255
+            return pixels
+        if self.colordepth&7==TIM_16BIT:
+            return ColorsToRGBA(self.texels)
+        #4-bit and 8-bit: entries missing from a short CLUT stay transparent black
+        clut=np.zeros(1<<(4 if self.colordepth&7==TIM_4BIT else 8),dtype=np.uint16)
+        row=self.colors[clut_row][:len(clut)]
+        clut[:len(row)]=row
+        return ColorsToRGBA(clut)[self.texels]
+
+def ColorsToRGBA(colors):
+    """PSX ABGR1555 colors to float32 RGBA(one more axis of 4).
+    STP rule: 0x0000 is the only transparent color, black with the STP bit is opaque black"""
+    colors=np.asarray(colors,dtype=np.uint16)
+    rgba=np.empty(colors.shape+(4,),dtype=np.float32)
+    rgba[...,0]=colors&0x1f
+    rgba[...,1]=(colors>>5)&0x1f
+    rgba[...,2]=(colors>>10)&0x1f
+    rgba[...,:3]/=31
+    rgba[...,3]=colors!=0
+    return rgba
+
+def ReadTim(data,offset=0):
+    """Read the TIM texture starting at offset in data(any bytes-like object). The texels are copied out of data"""
+    data=memoryview(data).cast('B')
+    magic,flags=struct.unpack_from('<II',data,offset)
+    if magic!=TIM_MAGIC:
+        raise ValueError("no TIM texture at {}".format(hex(offset)))
+    tim=TimImage_class()
+    tim.colordepth=flags
+    mode=flags&7
+    if mode>TIM_24BIT:
+        raise ValueError("TIM colordepth {} not supported".format(hex(flags)))
+    pos=offset+8
+
+    #-------PALETTE IF 4-bit or 8-bit image----------
+    if flags&TIM_HAS_CLUT:
+        palette=CLUT_class()
+        palette.imagesize,palette.x,palette.y,palette.pixH,palette.pixV=TIM_BLOCK.unpack_from(data,pos)
+        tim.palette=palette
+        tim.colors=np.frombuffer(data,dtype='<u2',count=palette.pixH*palette.pixV,offset=pos+TIM_BLOCK.size)\
+.reshape(palette.pixV,palette.pixH).copy()
+        pos+=palette.imagesize
+    elif mode<=TIM_8BIT:
+        raise ValueError("indexed TIM without palette at {}".format(hex(offset)))
+
+    #-------IMAGE----------
+    image=tim.image
+    image.imagesize,image.x,image.y,image.pixH,image.pixV=TIM_BLOCK.unpack_from(data,pos)
+    pos+=TIM_BLOCK.size
+    #pixH counts 16-bit words, a line is pixH*2 bytes
+    lines=np.frombuffer(data,dtype=np.uint8,count=image.pixH*2*image.pixV,offset=pos).reshape(image.pixV,image.pixH*2)
+    tim.height=image.pixV
+    if mode==TIM_4BIT:#2 pixels per byte, low nibble first
+        tim.width=image.pixH*4
+        tim.texels=np.stack((lines&0x0f,lines>>4),axis=-1).reshape(tim.height,tim.width)
+    elif mode==TIM_8BIT:
+        tim.width=image.pixH*2
+        tim.texels=lines.copy()
+    elif mode==TIM_16BIT:
+        tim.width=image.pixH
+        tim.texels=lines.view('<u2').copy()
+    else:#24-bit, the end of a line can be padding
+        tim.width=image.pixH*2//3
+        tim.texels=lines[:,:tim.width*3].reshape(tim.height,tim.width,3).copy()
+    return tim
+
+def DecodeTim(data,offset=0,clut_row=0):
+    """RGBA float32 array(height,width,4) of the TIM texture at offset, first line on top"""
+    return ReadTim(data,offset).rgba(clut_row)
+
+def ReadTextures(mch):
+    """RGBA arrays of all the TIM textures of a MchFile. A texture that can't be decoded is left blank(128x128, transparent)"""
+    textures=[]
+    for i,texoffset in enumerate(mch.TexOffsets):
+        try:
+            textures.append(DecodeTim(mch.data,texoffset))
+        except ValueError as error:
+            print("texture {}: {}".format(i,error))
+            textures.append(np.zeros((128,128,4),dtype=np.float32))#original texture is 128x128
+    return textures
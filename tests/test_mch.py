@@ -0,0 +1,38 @@
+"""Checks of the bpy-free model decoding of mchlib.mch, run with python -m pytest from the ff8_mch folder"""
+import os,sys
+import numpy as np
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mchlib import WeldUVs
+
+def test_weld_across_grid_cells():
+    #10 pixels limit:the pairs sit on both sides of a cell border, the far uv stays
+    uvs=np.array([[9.5,9.5],[10.5,10.5],[40,40],[19.9,0],[20.1,0]])
+    vt=np.array([[0,1,2,3],[3,4,2,0]])
+    welded,newvt=WeldUVs(uvs,vt,10/128)
+    assert len(welded)==3
+    assert newvt[0,0]==newvt[0,1] and newvt[1,0]==newvt[1,1]
+    assert np.allclose(welded[newvt[0,2]],(40,40))
+
+def test_weld_average_is_corner_weighted():
+    #uv 0 used by 3 corners, uv 1 by 1 corner:average at 3/4 of the way to uv 0
+    uvs=np.array([[0,0],[4,0],[100,100],[50,50]])
+    vt=np.array([[0,0,0,1],[2,3,2,3]])
+    welded,newvt=WeldUVs(uvs,vt,0.1)
+    assert np.allclose(welded[newvt[0,0]],(1,0))
+    assert (newvt[0]==newvt[0,0]).all()
+
+def test_weld_ignores_unused_triangle_corner():
+    #the 4th corner of triangles is (0,128) after the V flip, it must not move (5,120)
+    uvs=np.array([[0,128],[5,120],[50,50],[60,60]])
+    vt=np.array([[1,2,3,0],[1,3,2,0]])
+    used=np.array([[True,True,True,False]]*2)
+    welded,newvt=WeldUVs(uvs,vt,0.1,used)
+    assert np.allclose(welded[newvt[:,0]],(5,120))
+    assert np.allclose(welded[newvt[:,3]],(0,128))
+
+def test_no_weld_at_zero():
+    uvs=np.array([[0,0],[0.5,0]])
+    vt=np.array([[0,1,0,1]])
+    welded,newvt=WeldUVs(uvs,vt,0)
+    assert len(welded)==2 and newvt is vt
@@ -0,0 +1,83 @@
+"""Checks of the chara.one act writer of mchlib.one, run with python -m pytest from the ff8_mch folder"""
+import io,os,struct,sys
+import numpy as np
+import pytest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mchlib import (MchAnim_class,CharaOneIndex,ReadActHeaders,DecodeAct,EncodeAct,EncodeAnims,WriteAnims,
+    MchCache,ReadActsCached)
+
+def RandomAct(rng,frameCount,boneCount):
+    anim=MchAnim_class()
+    anim.frameCount,anim.boneCount=frameCount,boneCount
+    anim.offsets=rng.integers(-0x8000,0x8000,(frameCount,3)).astype(np.int16)
+    anim.rotations=(rng.integers(-0x200,0x200,(frameCount,boneCount,3))<<2).astype(np.int16)
+    return anim
+
+def CharaOne(blocks):
+    """Synthetic chara.one of main characters(no TIM), blocks is a list of (name,block bytes)"""
+    table=struct.pack('<I',len(blocks))
+    address=4+32*len(blocks)
+    for name,block in blocks:
+        #address is relative to the end of the character count, size is written twice, hasTim over 0xd0000000
+        table+=struct.pack('<IIII',address-4,len(block),len(block),0xd0000001)
+        table+=struct.pack('<I',0x100<<8)+name.encode()+bytes(8)
+        address+=len(block)
+    return table+b''.join(block for name,block in blocks)
+
+def test_encode_decode_act():
+    rng=np.random.default_rng(3)
+    anim=RandomAct(rng,7,5)
+    data=EncodeAct(anim)
+    assert len(data)==4+7*(6+4*5)
+    back=MchAnim_class()
+    back.frameCount,back.boneCount=struct.unpack_from('<HH',data)
+    DecodeAct(io.BytesIO(data),back)
+    assert np.array_equal(back.offsets,anim.offsets)
+    assert np.array_equal(back.rotations,anim.rotations)
+
+def test_write_anims(tmp_path):
+    rng=np.random.default_rng(4)
+    first=[RandomAct(rng,3,4),RandomAct(rng,2,4)]
+    second=[RandomAct(rng,4,6)]
+    blocks=[("d001",EncodeAnims(first)+bytes(-len(EncodeAnims(first))%4)),("d002",EncodeAnims(second))]
+    onepath=tmp_path/"chara.one"
+    onepath.write_bytes(CharaOne(blocks))
+    before=CharaOneIndex(str(onepath))
+
+    #an odd sized act list:the next character must stay 4 bytes aligned
+    acts=[RandomAct(rng,5,4),RandomAct(rng,1,4),RandomAct(rng,2,4)]
+    outpath=tmp_path/"chara-new.one"
+    delta=WriteAnims(str(onepath),str(outpath),"d001",acts)
+    assert len(EncodeAnims(acts))%4!=0 and delta%4==0
+    after=CharaOneIndex(str(outpath))
+    data=outpath.read_bytes()
+
+    d001,d002=after["d001"],after["d002"]
+    assert d001.Address==before["d001"].Address
+    assert d001.Size==before["d001"].Size+delta
+    assert struct.unpack_from('<II',data,d001.TableOffset+4)==(d001.Size,d001.Size)
+    assert d002.Address==before["d002"].Address+delta and d002.Address%4==0
+    assert d002.Size==before["d002"].Size
+    assert data[d002.Address:]==blocks[1][1]
+
+    with open(outpath,"rb") as onefile:
+        for alone,expected in ((d001,acts),(d002,second)):
+            animList=ReadActHeaders(onefile,alone)
+            assert len(animList)==len(expected)
+            for anim,act in zip(animList,expected):
+                DecodeAct(onefile,anim)
+                assert np.array_equal(anim.offsets,act.offsets)
+                assert np.array_equal(anim.rotations,act.rotations)
+
+def test_read_acts_cached_missing(tmp_path):
+    rng=np.random.default_rng(6)
+    acts=[RandomAct(rng,2,3)]
+    onepath=tmp_path/"chara.one"
+    onepath.write_bytes(CharaOne([("d001",EncodeAnims(acts)+bytes(-len(EncodeAnims(acts))%4))]))
+    #same error with and without a cache
+    for cache in (None,MchCache(str(tmp_path/"cache"))):
+        assert np.array_equal(ReadActsCached(str(onepath),"d001",[0],cache)[0].rotations,acts[0].rotations)
+        for char_name,numbers in (("d002",[0]),("d001",[1])):
+            with pytest.raises(ValueError):
+                ReadActsCached(str(onepath),char_name,numbers,cache)
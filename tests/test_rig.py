@@ -0,0 +1,77 @@
+"""Checks of the bpy-free retarget maths of mchlib.rig, run with python -m pytest from the ff8_mch folder"""
+import math,os,sys
+import numpy as np
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mchlib import (MchAnim_class,EulerToMatrix,CompatibleEuler,RawEulers,PoseMatrices,
+    RetargetAnim,RetargetToRaw,ReduceKeys)
+
+def compatible_eul(eul,old):
+    """Scalar port of blender compatible_eul(BLI math_rotation)"""
+    eul=list(eul)
+    deul=[0.0,0.0,0.0]
+    for i in range(3):
+        deul[i]=eul[i]-old[i]
+        if deul[i]>5.1:
+            eul[i]-=math.floor(deul[i]/(2*math.pi)+0.5)*2*math.pi
+            deul[i]=eul[i]-old[i]
+        elif deul[i]<-5.1:
+            eul[i]+=math.floor(-deul[i]/(2*math.pi)+0.5)*2*math.pi
+            deul[i]=eul[i]-old[i]
+    for i,j,k in ((0,1,2),(1,2,0),(2,0,1)):
+        if abs(deul[i])>3.2 and abs(deul[j])<1.6 and abs(deul[k])<1.6:
+            eul[i]+=-2*math.pi if deul[i]>0 else 2*math.pi
+    return eul
+
+def test_compatible_euler_matches_blender():
+    rng=np.random.default_rng(1)
+    eulers=rng.uniform(-10,10,(2000,3))
+    old=rng.uniform(-4,4,(2000,3))
+    expected=np.array([compatible_eul(e,o) for e,o in zip(eulers,old)])
+    assert np.allclose(CompatibleEuler(eulers,old),expected)
+
+def Skeleton(rng):
+    """Random rest matrices of a 6 bones skeleton, parent first"""
+    parents=[-1,0,1,1,0,4]
+    rest=np.broadcast_to(np.eye(4),(len(parents),4,4)).copy()
+    rest[:,:3,:3]=EulerToMatrix(rng.uniform(-math.pi,math.pi,(len(parents),3)))
+    rest[:,:3,3]=rng.uniform(-1,1,(len(parents),3))
+    return parents,rest
+
+def test_retarget_round_trip():
+    rng=np.random.default_rng(2)
+    parents,raw_rest=Skeleton(rng)
+    rest=Skeleton(rng)[1]
+    anim=MchAnim_class()
+    anim.frameCount,anim.boneCount=20,len(parents)
+    anim.offsets=rng.integers(-2000,2000,(20,3)).astype(np.int16)
+    anim.rotations=(rng.integers(-0x200,0x200,(20,len(parents),3))<<2).astype(np.int16)
+    anim.rotations[:,:,0]=(rng.integers(-0x100,0x100,(20,len(parents)))<<2)#X under 90 degrees
+    rotations,locations=RetargetAnim(raw_rest,rest,parents,anim,300.0)
+    offsets,raw=RetargetToRaw(raw_rest,rest,parents,rotations,locations,300.0)
+    assert np.array_equal(offsets,anim.offsets)
+    back=MchAnim_class()
+    back.offsets,back.rotations=offsets,raw
+    assert np.allclose(EulerToMatrix(RawEulers(back)),EulerToMatrix(RawEulers(anim)),atol=1e-9)
+    #both poses put the bones at the same place
+    pose=PoseMatrices(rest,parents,rotations,locations)
+    again=PoseMatrices(rest,parents,*RetargetAnim(raw_rest,rest,parents,back,300.0))
+    assert np.allclose(pose,again,atol=1e-9)
+
+def test_reduce_keys_error_bound():
+    rng=np.random.default_rng(5)
+    frames=np.arange(120)
+    #smooth curves, a step and noise:every channel gets its own keys
+    values=np.stack((np.sin(frames/9),np.cumsum(rng.normal(0,0.05,120)),np.where(frames<60,0.0,1.0),
+        rng.normal(0,0.01,120)),axis=1)
+    for tolerance in (0.001,0.01,0.1):
+        keep=ReduceKeys(values,tolerance)
+        assert keep.shape==values.shape
+        assert keep[0].all() and keep[-1].all()
+        for channel in range(values.shape[1]):
+            keys=np.flatnonzero(keep[:,channel])
+            lerp=np.interp(frames,keys,values[keys,channel])
+            assert np.abs(lerp-values[:,channel]).max()<=tolerance
+    #a straight line only keeps its ends
+    line=ReduceKeys(np.linspace(0,1,50)[:,None],1e-9)
+    assert np.array_equal(np.flatnonzero(line[:,0]),[0,49])
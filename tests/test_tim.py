@@ -0,0 +1,67 @@
+"""Checks of the bpy-free TIM decoding of mchlib.tim, run with python -m pytest from the ff8_mch folder"""
+import os,struct,sys
+import numpy as np
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mchlib import ReadTim,DecodeTim,ColorsToRGBA
+
+def Tim(flags,pixH,pixV,pixels,clut=None):
+    """Synthetic TIM:clut is a (rows,colors) list of ABGR1555 colors, pixels the raw bytes of the image block"""
+    data=struct.pack('<II',0x10,flags)
+    if clut is not None:
+        clut=np.asarray(clut,dtype='<u2')
+        data+=struct.pack('<I4H',12+clut.nbytes,0,0,clut.shape[1],clut.shape[0])+clut.tobytes()
+    assert len(pixels)==pixH*2*pixV
+    return data+struct.pack('<I4H',12+len(pixels),0,0,pixH,pixV)+bytes(pixels)
+
+def test_colors_stp():
+    #0x0000 is transparent, black with the STP bit is opaque, white and pure red are opaque
+    rgba=ColorsToRGBA([0x0000,0x8000,0x7fff,0x001f])
+    assert np.array_equal(rgba[:,3],[0,1,1,1])
+    assert np.allclose(rgba[2,:3],1) and np.allclose(rgba[3,:3],(1,0,0))
+
+def test_4bit_low_nibble_first():
+    clut=[[0x0000,0x001f,0x03e0,0x7c00]]#short CLUT:4 colors out of 16
+    tim=ReadTim(Tim(0x08,1,2,[0x10,0x32,0x21,0xf3],clut))
+    assert (tim.width,tim.height)==(4,2)
+    assert np.array_equal(tim.texels[0],[0,1,2,3])
+    assert np.array_equal(tim.texels[1],[1,2,3,15])
+    rgba=tim.rgba()
+    assert np.allclose(rgba[0,1],(1,0,0,1)) and np.allclose(rgba[0,3],(0,0,1,1))
+    #index 15 is past the short CLUT:transparent black
+    assert np.allclose(rgba[1,3],0)
+
+def test_8bit_clut_rows():
+    clut=[[0x001f,0x03e0],[0x7c00,0x7fff]]
+    data=Tim(0x09,1,1,[1,0],clut)
+    tim=ReadTim(data)
+    assert np.array_equal(tim.texels,[[1,0]])
+    assert np.allclose(DecodeTim(data,0,0)[0],[(0,1,0,1),(1,0,0,1)])
+    assert np.allclose(DecodeTim(data,0,1)[0],[(1,1,1,1),(0,0,1,1)])
+
+def test_16bit():
+    colors=np.array([[0x0000,0x8000],[0x001f,0x7c00]],dtype='<u2')
+    tim=ReadTim(Tim(0x02,2,2,colors.tobytes()))
+    assert tim.palette is None and (tim.width,tim.height)==(2,2)
+    rgba=tim.rgba()
+    assert np.array_equal(rgba[...,3],[[0,1],[1,1]])
+    assert np.allclose(rgba[1,1],(0,0,1,1))
+
+def test_24bit_line_padding():
+    #3 pixels are 9 bytes, a line is 5 words(10 bytes):1 byte of padding per line
+    lines=[bytes([255,0,0,0,255,0,0,0,255,0xaa]),bytes([1,2,3,4,5,6,7,8,9,0xbb])]
+    tim=ReadTim(Tim(0x03,5,2,b''.join(lines)))
+    assert (tim.width,tim.height)==(3,2)
+    assert np.array_equal(tim.texels[1],[[1,2,3],[4,5,6],[7,8,9]])
+    rgba=tim.rgba()
+    assert np.allclose(rgba[0],[(1,0,0,1),(0,1,0,1),(0,0,1,1)])
+
+def test_offset_and_errors():
+    data=bytes(6)+Tim(0x02,1,1,[0xff,0x7f])
+    assert np.allclose(DecodeTim(data,6),[[(1,1,1,1)]])
+    for bad in (bytes(16),struct.pack('<II',0x10,0x04)+bytes(24)):
+        try:
+            ReadTim(bad)
+        except ValueError:
+            continue
+        assert False,"ValueError expected"